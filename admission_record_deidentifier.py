@@ -25,27 +25,257 @@
 Author: ltesla
 """
 
+import io
 import re
+import difflib
 import sys
+import zipfile
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from collections import OrderedDict
 from docx import Document
 from docx.shared import Pt, RGBColor
 from docx.oxml.ns import qn
 
+# 可选: 安装 google-re2 后,大文本扫描用的正则改用 RE2(线性时间,无回溯)
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+
+# 段落/单元格之间的分隔符(U+241F,医疗文本中不会出现),整篇文档拼接后一次脱敏
+_SEGMENT_SEP = '\u241F'
+
+# 待脱敏段落数超过该阈值时分块并行处理(小文件不值得启动线程池)
+_PARALLEL_MIN_SEGMENTS = 50
+_PARALLEL_WORKERS = 4
+
+# 识别阶段直接遍历XML时用到的元素标签
+_W_P = qn('w:p')
+_W_R = qn('w:r')
+_W_T = qn('w:t')
+_RUN_CHILD_TEXT = {qn('w:tab'): '\t', qn('w:br'): '\n', qn('w:cr'): '\n'}
+_XML_SPACE = qn('xml:space')
+
+
+def _compile_fast(pattern):
+    """优先用 RE2 编译正则;未安装或语法不受支持时退回标准库 re"""
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except re2.error:
+            pass
+    return re.compile(pattern)
+
+
+def _build_trie_regex(words, suffix=False):
+    """将词表构建为字典树形式的正则,共享公共前缀(suffix=True 时共享公共后缀)
+    
+    例如 ['人民医院', '中医院', '医院', '卫生院'] 构建为 (?:(?:人民|中)?医|卫生)院,
+    避免普通多选分支在不匹配时逐个回溯。
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in (reversed(word) if suffix else word):
+            node = node.setdefault(ch, {})
+        node[''] = {}
+    
+    def render(node):
+        branches = []
+        singles = []
+        for ch in sorted(k for k in node if k):
+            child = node[ch]
+            if list(child) == ['']:
+                singles.append(re.escape(ch))
+            else:
+                rest = render(child)
+                branches.append(rest + re.escape(ch) if suffix else re.escape(ch) + rest)
+        if singles:
+            branches.append(singles[0] if len(singles) == 1 else '[%s]' % ''.join(singles))
+        
+        if len(branches) == 1:
+            body, grouped = branches[0], False
+        else:
+            body, grouped = '(?:%s)' % '|'.join(branches), True
+
+        if '' in node:
+            # 当前位置已可结束: 其余部分可选(贪婪,优先匹配更长的词)
+            return body + '?' if grouped else '(?:%s)?' % body
+        return body
+    
+    return render(trie)
+
+
+def _restore_colons(original, masked):
+    """脱敏结果中未改动的部分换回原文字符,原文的全角冒号保持不变
+    
+    process_text 把冒号统一成半角后才匹配规则;回写文档时只应改写被脱敏的片段,
+    否则同一文档中有命中的段落变成半角冒号,没有命中的段落仍是全角。
+    """
+    if '：' not in original:
+        return masked
+    normalized = original.translate(_COLON_TABLE)
+    if normalized == masked:
+        return original
+    parts = []
+    matcher = difflib.SequenceMatcher(None, normalized, masked, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        # 对齐相同的区间与原文只差冒号形式,取原文;其余为脱敏后的新内容
+        parts.append(original[i1:i2] if tag == 'equal' else masked[j1:j2])
+    return ''.join(parts)
+
+
+def _split_by_runs(old_texts, new_text):
+    """按原各段(run)的长度把脱敏后的文本切回各段
+    
+    新旧文本的公共前缀/后缀按原位置切分,中间发生变化的部分整体归入
+    变化起点所在的段,其后落在变化区间内的段置空。
+    """
+    old_text = ''.join(old_texts)
+    prefix = 0
+    limit = min(len(old_text), len(new_text))
+    while prefix < limit and old_text[prefix] == new_text[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_text[-1 - suffix] == new_text[-1 - suffix]:
+        suffix += 1
+    old_end = len(old_text) - suffix
+    new_end = len(new_text) - suffix
+    
+    def new_pos(pos):
+        if pos <= prefix:
+            return pos
+        if pos >= old_end:
+            return pos - old_end + new_end
+        return new_end
+    
+    pieces = []
+    offset = 0
+    for text in old_texts:
+        pieces.append(new_text[new_pos(offset):new_pos(offset + len(text))])
+        offset += len(text)
+    return pieces
+
+
+# 全角冒号统一转为半角,之后所有正则只需处理 ':'
+_COLON_TABLE = str.maketrans({'：': ':'})
+
+# 预编译正则(模块导入时编译一次,所有文档共用;均作用于冒号归一化后的文本)
+_PAT_PATIENT_NAME = [
+    re.compile(r'姓\s*名:\s*([\u4e00-\u9fa5]{2,4})'),
+    re.compile(r'患者:\s*([\u4e00-\u9fa5]{2,4})'),
+]
+# 出生日期 / 生日: YYYY-MM-DD
+_PAT_BIRTH = re.compile(
+    r'(?P<birth>(?P<birth_label>出生[日期]*|生日):\s*(?P<birth_year>\d{4})[-/年]\d{1,2}[-/月]\d{1,2})'
+)
+_PAT_ADDRESS = [
+    re.compile(r'(?:现住址|家庭住址|住址|地址|户籍地址):\s*([^\n\u241F]+)'),
+    re.compile(r'(?:出生地):\s*([^\n\u241F]+)'),
+]
+# 省/市/区县合并为一个正则;非贪婪量词避免跨越行政区划边界
+_PAT_ADMIN = re.compile(
+    r'(?P<province>[\u4e00-\u9fa5]{2,}?省)'
+    r'|(?P<city>[\u4e00-\u9fa5]{2,}?市)'
+    r'|(?P<district>[\u4e00-\u9fa5]{2,}?(?:区|县))'
+)
+# 带标签的医疗编号合并为一个正则,标签由分组保留,替换时无需再 split
+_PAT_MEDICAL_CODES = re.compile(
+    # 住院号、病案号、门诊号等
+    r'(?P<visit>(?:住院号|入院号|病案号|门诊号|就诊号):)\s*[\dA-Z\-]+'
+    # 检查号、病理号
+    r'|(?P<exam>(?:检查号|病理号|标本号):)\s*[A-Z0-9_\-]+'
+)
+
+# 固定格式编号合并为一个正则,一次扫描完成替换
+_PAT_FIXED = re.compile(
+    # 18位或15位身份证;两端用数字环视界定,\b 在紧邻汉字时不生效
+    r'(?P<id>(?<!\d)(?:\d{18}|\d{17}[Xx]|\d{15})(?![\dXx]))'
+    r'|(?P<phone>\b1[3-9]\d{9}\b)'              # 11位手机号
+    r'|(?P<pfcode>(?:PF|BF|HY)\d{4}-\d{5,8})'    # 病理单号格式: PF2025-08549
+)
+_FIXED_REPLACEMENTS = {
+    'id': '[身份证号已脱敏]',
+    'phone': '[手机号已脱敏]',
+    'pfcode': 'CODE',
+}
+
+
+def _letter(index):
+    """编号转字母: 0→A, 25→Z, 26→AA, 27→AB ...(超过26个时不再产生非字母字符)"""
+    letters = ''
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def _replace_birth(match):
+    """出生日期只保留年份,标签统一为 出生日期 / 生日"""
+    label = '生日' if match.group('birth_label') == '生日' else '出生日期'
+    return f"{label}:{match.group('birth_year')}年"
+
+
+# 不作为医院名称的通用词
+_HOSPITAL_EXCLUDE = frozenset({'我院', '本院', '贵院', '医院'})
+_DOCTOR_EXCLUDE = frozenset({'请选择', '请输入', '主任', '副主任', '主治', '住院'})
+
+# 候选字符: 编号/日期类规则都需要数字,带标签的规则都需要冒号
+_TRIGGER_CHARS = '0123456789:：'
+
 
 class MedicalDeIdentifier:
     """医疗文书脱敏处理器（符合脱敏规范）"""
     
+    # 医院名称后缀
+    HOSPITAL_SUFFIXES = [
+        '临床病理诊断中心', '病理诊断中心', '医疗中心',
+        '人民医院', '中心医院', '第一医院', '第二医院', '第三医院',
+        '妇幼保健院', '儿童医院', '中医院', '专科医院', 
+        '卫生院', '卫生所', '诊所', '医院'
+    ]
+    
+    # 医院名称前可能出现的动词
+    HOSPITAL_PREFIXES = ['于', '在', '至', '到', '复习', '前往', '转入', '转出']
+    
+    # 匹配医院名称,前面的动词一般在捕获组之外(后缀/动词均构建为字典树正则)
+    # 汉字范围直接写成字面字符,RE2 不支持 \u 转义
+    HOSPITAL_PATTERN = _compile_fast(
+        r'%s?\s*(?P<name>%s{2,20}%s)'
+        % (_build_trie_regex(HOSPITAL_PREFIXES), '[\u4e00-\u9fa5]',
+           _build_trie_regex(HOSPITAL_SUFFIXES, suffix=True))
+    )
+    
+    # 医生签名模式
+    DOCTOR_PATTERNS = [
+        re.compile(r'医生签名:\s*([\u4e00-\u9fa5]{2,4})'),
+        re.compile(r'(?:主治医师|主任医师|副主任医师|住院医师):\s*([\u4e00-\u9fa5]{2,4})'),
+        re.compile(r'(?:医师|医生):\s*([\u4e00-\u9fa5]{2,4})'),
+    ]
+    
     def __init__(self):
         """初始化"""
         # 医生映射 (doctorA, doctorB, doctorC...)
-        self.doctor_mapping = OrderedDict()
-        self.doctor_counter = 0
+        self.doctor_mapping = {}
         
         # 医院映射 (hospital A, hospital B, hospital C...)
-        self.hospital_mapping = OrderedDict()
-        self.hospital_counter = 0
+        self.hospital_mapping = {}
+        
+        # 映射替换用的合并正则(识别完成后构建)
+        self._hospital_pat = None
+        self._doctor_pat = None
+        
+        # 候选字符预检正则(惰性构建,识别结果变化后重建)
+        self._trigger_re = None
+        
+        # 医院/医生/出生日期规则合并成的总正则(惰性构建,识别结果变化后重建)
+        self._master_re = None
+        
+        # 按原文缓存脱敏结果(识别结果变化后清空)
+        self._cached_process = functools.lru_cache(maxsize=4096)(self.process_text)
         
         # 患者姓名
         self.patient_name = None
@@ -53,94 +283,84 @@ class MedicalDeIdentifier:
     def extract_patient_name(self, text):
         """从文本中提取患者姓名"""
         # 匹配 "姓名:XXX" 或 "姓 名:XXX"
-        patterns = [
-            r'姓\s*名[:：]\s*([\u4e00-\u9fa5]{2,4})',
-            r'患者[:：]\s*([\u4e00-\u9fa5]{2,4})',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text)
+        text = text.translate(_COLON_TABLE)
+        for pattern in _PAT_PATIENT_NAME:
+            match = pattern.search(text)
             if match:
                 return match.group(1)
         
         return None
     
     def identify_hospitals(self, text):
-        """识别并映射医院名称"""
-        # 医院名称后缀
-        hospital_suffixes = [
-            '临床病理诊断中心', '病理诊断中心', '医疗中心',
-            '人民医院', '中心医院', '第一医院', '第二医院', '第三医院',
-            '妇幼保健院', '儿童医院', '中医院', '专科医院', 
-            '卫生院', '卫生所', '诊所', '医院'
-        ]
-        
-        # 按长度排序(长的优先匹配)
-        hospital_suffixes.sort(key=len, reverse=True)
-        
-        # 构建正则表达式
-        suffix_pattern = '|'.join(re.escape(s) for s in hospital_suffixes)
-        
-        # 匹配医院名称,排除前面的动词
-        pattern = rf'(?:于|在|至|到|复习|前往|转入|转出)?\s*([\u4e00-\u9fa5]{{2,20}}(?:{suffix_pattern}))'
-        
-        matches = re.finditer(pattern, text)
-        seen_hospitals = set()
+        """
+        识别并映射医院名称
         
-        for match in matches:
-            hospital_name = match.group(1).strip()
+        >>> d = MedicalDeIdentifier()
+        >>> d.identify_hospitals('入院情况\\n于北京协和医院住院治疗')
+        >>> dict(d.hospital_mapping)
+        {'北京协和医院': 'hospital A'}
+        """
+        for match in self.HOSPITAL_PATTERN.finditer(text):
+            hospital_name = match.group('name')
             
-            # 清理医院名称前缀
-            for prefix in ['于', '在', '至', '到', '复习', '前往', '转入', '转出']:
+            # 匹配从空白/行首开始时,可选的动词分组被跳过,动词会落进名称里,需再清理
+            for prefix in self.HOSPITAL_PREFIXES:
                 if hospital_name.startswith(prefix):
                     hospital_name = hospital_name[len(prefix):].strip()
             
-            # 过滤通用词
-            if hospital_name in ['我院', '本院', '贵院', '医院']:
-                continue
-            
-            # 过滤过短的名称
-            if len(hospital_name) < 5:
-                continue
-            
-            # 避免重复
-            if hospital_name in seen_hospitals:
+            # 过滤通用词和过短的名称
+            if hospital_name in _HOSPITAL_EXCLUDE or len(hospital_name) < 5:
                 continue
             
-            seen_hospitals.add(hospital_name)
-            
-            # 添加到映射
+            # 按首次出现顺序编号: A, B, C...(映射大小即已分配的数量)
             if hospital_name not in self.hospital_mapping:
-                self.hospital_counter += 1
-                letter = chr(64 + self.hospital_counter)  # A, B, C...
-                self.hospital_mapping[hospital_name] = f'hospital {letter}'
+                self.hospital_mapping[hospital_name] = f'hospital {_letter(len(self.hospital_mapping))}'
+        
+        self._hospital_pat = self._compile_mapping(self.hospital_mapping)
+        self._reset_caches()
     
     def identify_doctors(self, text):
         """识别并映射医生姓名"""
-        # 医生签名模式
-        patterns = [
-            r'医生签名[:：]\s*([\u4e00-\u9fa5]{2,4})',
-            r'(?:主治医师|主任医师|副主任医师|住院医师)[:：]\s*([\u4e00-\u9fa5]{2,4})',
-            r'(?:医师|医生)[:：]\s*([\u4e00-\u9fa5]{2,4})',
-        ]
-        
-        # 排除词汇
-        exclude_words = ['请选择', '请输入', '主任', '副主任', '主治', '住院']
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, text)
-            for match in matches:
+        text = text.translate(_COLON_TABLE)
+        for pattern in self.DOCTOR_PATTERNS:
+            for match in pattern.finditer(text):
                 doctor_name = match.group(1)
                 
-                # 过滤
-                if doctor_name in exclude_words or len(doctor_name) < 2:
+                # 过滤排除词汇
+                if doctor_name in _DOCTOR_EXCLUDE or len(doctor_name) < 2:
                     continue
                 
-                # 添加到映射
                 if doctor_name not in self.doctor_mapping:
-                    self.doctor_counter += 1
-                    letter = chr(64 + self.doctor_counter)  # A, B, C...
-                    self.doctor_mapping[doctor_name] = f'doctor{letter}'
+                    self.doctor_mapping[doctor_name] = f'doctor{_letter(len(self.doctor_mapping))}'
+        
+        self._doctor_pat = self._compile_mapping(self.doctor_mapping)
+        self._reset_caches()
+    
+    def _reset_caches(self):
+        """识别结果变化后清空预检正则和脱敏结果缓存"""
+        self._trigger_re = None
+        self._master_re = None
+        self._cached_process.cache_clear()
+    
+    @staticmethod
+    def _compile_mapping(mapping):
+        """将映射表编译为单一正则,一次扫描完成全部替换"""
+        if not mapping:
+            return None
+        # 按名称长度从长到短排列,避免误替换
+        names = sorted(mapping, key=len, reverse=True)
+        return _compile_fast('|'.join(re.escape(name) for name in names))
+    
+    def has_candidates(self, text):
+        """文本中是否含有可能命中脱敏规则的字符"""
+        if self._trigger_re is None:
+            chars = set(_TRIGGER_CHARS)
+            chars.update(name[0] for name in self.hospital_mapping)
+            chars.update(name[0] for name in self.doctor_mapping)
+            if self.patient_name:
+                chars.add(self.patient_name[0])
+            self._trigger_re = re.compile('[%s]' % ''.join(re.escape(c) for c in sorted(chars)))
+        return self._trigger_re.search(text) is not None
     
     def mask_patient_name(self, text):
         """患者姓名 → patient"""
@@ -150,134 +370,102 @@ class MedicalDeIdentifier:
     
     def mask_hospitals(self, text):
         """医院名称 → hospital A/B/C"""
-        # 按名称长度从长到短排序,避免误替换
-        sorted_hospitals = sorted(
-            self.hospital_mapping.items(),
-            key=lambda x: len(x[0]),
-            reverse=True
-        )
-        
-        for hospital_name, replacement in sorted_hospitals:
-            text = text.replace(hospital_name, replacement)
-        
-        return text
+        if self._hospital_pat is None:
+            return text
+        return self._hospital_pat.sub(lambda m: self.hospital_mapping[m.group(0)], text)
     
     def mask_doctors(self, text):
         """医生姓名 → doctorA/B/C"""
-        sorted_doctors = sorted(
-            self.doctor_mapping.items(),
-            key=lambda x: len(x[0]),
-            reverse=True
-        )
-        
-        for doctor_name, replacement in sorted_doctors:
-            text = text.replace(doctor_name, replacement)
-        
-        return text
+        if self._doctor_pat is None:
+            return text
+        return self._doctor_pat.sub(lambda m: self.doctor_mapping[m.group(0)], text)
     
     def mask_birth_date(self, text):
         """出生日期 → 仅保留年份"""
-        # 匹配各种日期格式
-        patterns = [
-            # 出生日期: YYYY-MM-DD
-            (r'出生[日期]*[:：]\s*(\d{4})[-/年](\d{1,2})[-/月](\d{1,2})',
-             lambda m: f"出生日期：{m.group(1)}年"),
-            
-            # 生日: YYYY-MM-DD
-            (r'生日[:：]\s*(\d{4})[-/年](\d{1,2})[-/月](\d{1,2})',
-             lambda m: f"生日：{m.group(1)}年"),
-        ]
-        
-        for pattern, replacer in patterns:
-            text = re.sub(pattern, replacer, text)
-        
-        return text
+        return _PAT_BIRTH.sub(_replace_birth, text)
     
     def mask_address(self, text):
         """详细地址 → [地址已脱敏] (保留省市区)"""
-        # 匹配地址
-        address_patterns = [
-            r'(?:现住址|家庭住址|住址|地址|户籍地址)[:：]\s*([^\n]+)',
-            r'(?:出生地)[:：]\s*([^\n]+)',
-        ]
-        
-        for pattern in address_patterns:
+        for pattern in _PAT_ADDRESS:
             def replace_address(match):
                 full_text = match.group(0)
                 address = match.group(1)
                 
-                # 提取省市区(保留)
-                province = re.search(r'([\u4e00-\u9fa5]{2,}省)', address)
-                city = re.search(r'([\u4e00-\u9fa5]{2,}市)', address)
-                district = re.search(r'([\u4e00-\u9fa5]{2,}(?:区|县))', address)
-                
-                preserved_parts = []
-                if province:
-                    preserved_parts.append(province.group(1))
-                if city:
-                    preserved_parts.append(city.group(1))
-                if district:
-                    preserved_parts.append(district.group(1))
+                # 提取省市区(保留),一次扫描,每一级只取第一个
+                preserved = {}
+                for admin in _PAT_ADMIN.finditer(address):
+                    preserved.setdefault(admin.lastgroup, admin.group(0))
+                preserved_parts = list(preserved.values())
                 
                 # 获取标签
-                label = full_text.split('：')[0] if '：' in full_text else full_text.split(':')[0]
+                label = full_text.split(':')[0]
                 
                 if preserved_parts:
-                    return f"{label}：{' '.join(preserved_parts)} [地址已脱敏]"
+                    return f"{label}:{' '.join(preserved_parts)} [地址已脱敏]"
                 else:
-                    return f"{label}：[地址已脱敏]"
+                    return f"{label}:[地址已脱敏]"
             
-            text = re.sub(pattern, replace_address, text)
+            text = pattern.sub(replace_address, text)
         
         return text
     
-    def mask_id_card(self, text):
-        """身份证号 → [身份证号已脱敏]"""
-        # 18位或15位身份证
-        text = re.sub(r'\b\d{15}|\d{17}[\dXx]\b', '[身份证号已脱敏]', text)
-        return text
-    
-    def mask_phone(self, text):
-        """手机号 → [手机号已脱敏]"""
-        # 11位手机号
-        text = re.sub(r'\b1[3-9]\d{9}\b', '[手机号已脱敏]', text)
-        return text
+    def mask_identifiers(self, text):
+        """身份证号 / 手机号 / 病理单号 → [身份证号已脱敏] / [手机号已脱敏] / CODE"""
+        return _PAT_FIXED.sub(lambda m: _FIXED_REPLACEMENTS[m.lastgroup], text)
     
     def mask_medical_codes(self, text):
-        """医疗编号 → CODE"""
-        # 住院号、病案号、门诊号等
-        medical_code_patterns = [
-            (r'(?:住院号|入院号|病案号|门诊号|就诊号)[:：]\s*[\dA-Z\-]+',
-             lambda m: m.group(0).split('：')[0] + '：CODE' if '：' in m.group(0) 
-                      else m.group(0).split(':')[0] + ':CODE'),
-            
-            # 检查号、病理号
-            (r'(?:检查号|病理号|标本号)[:：]\s*[A-Z0-9_\-]+',
-             lambda m: m.group(0).split('：')[0] + '：CODE' if '：' in m.group(0)
-                      else m.group(0).split(':')[0] + ':CODE'),
-            
-            # 病理单号格式: PF2025-08549
-            (r'(?:PF|BF|HY)\d{4}-\d{5,8}', 'CODE'),
-        ]
-        
-        for pattern, replacement in medical_code_patterns:
-            text = re.sub(pattern, replacement, text)
+        """医疗编号(带标签) → CODE"""
+        # 住院号、病案号、门诊号、检查号等,一次扫描
+        return _PAT_MEDICAL_CODES.sub(lambda m: m.group(m.lastgroup) + 'CODE', text)
+    
+    def _master_pattern(self):
+        """
+        医院/医生/出生日期规则合并为一个正则,按分组名分派替换
         
-        return text
+        这三类匹配互不重叠(医院/医生是识别出的纯汉字词,出生日期须带冒号和数字),
+        合并后与逐条替换结果相同;身份证/手机号与带标签编号会重叠
+        (如 "住院号:110105198001011234"),仍在地址之后按原顺序各扫一遍
+        """
+        if self._master_re is None:
+            # 分支顺序即原先逐条替换的优先级
+            parts = []
+            if self._hospital_pat is not None:
+                parts.append('(?P<hospital>%s)' % self._hospital_pat.pattern)
+            if self._doctor_pat is not None:
+                parts.append('(?P<doctor>%s)' % self._doctor_pat.pattern)
+            parts.append(_PAT_BIRTH.pattern)
+            self._master_re = re.compile('|'.join(parts))
+        return self._master_re
+    
+    def _replace_master(self, match):
+        """总正则的替换回调"""
+        kind = match.lastgroup
+        if kind == 'hospital':
+            return self.hospital_mapping[match.group(kind)]
+        if kind == 'doctor':
+            return self.doctor_mapping[match.group(kind)]
+        return _replace_birth(match)
     
     def process_text(self, text):
         """完整的脱敏处理流程"""
         if not text or not text.strip():
             return text
         
-        # 按顺序应用所有脱敏规则
+        # 不含任何候选字符时无需逐条规则扫描
+        if not self.has_candidates(text):
+            return text
+        
+        # 冒号归一化(输出中的冒号统一为半角)
+        text = text.translate(_COLON_TABLE)
+        
+        # 患者姓名须先于医院识别结果替换(识别出的医院名可能包含患者姓名);
+        # 随后一次扫描完成医院/医生/出生日期替换;
+        # 地址的替换依赖地址内部的省市区,单独再扫一遍;
+        # 编号先替换身份证/手机号再替换带标签编号,标签后的证件号按证件号脱敏
         text = self.mask_patient_name(text)
-        text = self.mask_hospitals(text)
-        text = self.mask_doctors(text)
-        text = self.mask_birth_date(text)
+        text = self._master_pattern().sub(self._replace_master, text)
         text = self.mask_address(text)
-        text = self.mask_id_card(text)
-        text = self.mask_phone(text)
+        text = self.mask_identifiers(text)
         text = self.mask_medical_codes(text)
         
         return text
@@ -324,12 +512,15 @@ class AdmissionRecordProcessor:
             
             # 第二步: 处理文档内容
             print("\n正在脱敏处理...")
-            self._process_paragraphs(doc)
-            self._process_tables(doc)
+            paragraphs, cells = self._collect_segments(doc)
+            new_texts = self._mask_segments([para.text for para in paragraphs] +
+                                            [cell.text for cell in cells])
+            self._process_paragraphs(paragraphs, new_texts[:len(paragraphs)])
+            self._process_tables(cells, new_texts[len(paragraphs):])
             
             # 第三步: 保存文档
             print(f"\n正在保存文档...")
-            doc.save(self.output_file)
+            self._save_document(doc)
             
             # 显示结果
             self._print_results()
@@ -343,56 +534,140 @@ class AdmissionRecordProcessor:
             return 1
     
     def _extract_all_text(self, doc):
-        """提取文档中的所有文本"""
+        """提取文档中的所有文本(仅用于识别,直接遍历XML而不构建段落/单元格对象)"""
         all_text = []
         
-        # 提取段落
-        for para in doc.paragraphs:
-            if para.text.strip():
-                all_text.append(para.text)
-        
-        # 提取表格
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    if cell.text.strip():
-                        all_text.append(cell.text)
+        # 正文段落和表格中的段落都是 body 下的 w:p
+        for p in doc.element.body.iter(_W_P):
+            parts = []
+            for r in p.iter(_W_R):
+                for child in r:
+                    if child.tag == _W_T:
+                        parts.append(child.text or '')
+                    elif child.tag in _RUN_CHILD_TEXT:
+                        parts.append(_RUN_CHILD_TEXT[child.tag])
+            text = ''.join(parts)
+            if text.strip():
+                all_text.append(text)
         
         return '\n'.join(all_text)
     
-    def _process_paragraphs(self, doc):
-        """处理段落"""
-        for para in doc.paragraphs:
-            if para.text.strip():
-                # 保存原始格式
-                original_runs = [(run.text, run.font.size, run.font.bold, 
-                                run.font.italic, run.font.name) 
-                               for run in para.runs]
-                
-                # 脱敏处理
-                new_text = self.deidentifier.process_text(para.text)
-                
-                # 清除段落内容
-                para.clear()
-                
-                # 重新添加文本(保持格式)
-                run = para.add_run(new_text)
-                if original_runs:
-                    run.font.size = original_runs[0][1]
-                    run.font.bold = original_runs[0][2]
-                    run.font.italic = original_runs[0][3]
-                    if original_runs[0][4]:
-                        run.font.name = original_runs[0][4]
-    
-    def _process_tables(self, doc):
-        """处理表格"""
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    if cell.text.strip():
-                        # 脱敏处理
-                        new_text = self.deidentifier.process_text(cell.text)
-                        cell.text = new_text
+    def _collect_segments(self, doc):
+        """收集需要脱敏的非空段落和表格单元格"""
+        paragraphs = [para for para in doc.paragraphs if para.text.strip()]
+        cells = [cell
+                 for table in doc.tables
+                 for row in table.rows
+                 for cell in row.cells
+                 if cell.text.strip()]
+        return paragraphs, cells
+    
+    def _mask_segments(self, texts):
+        """拼接所有段落/单元格文本一次性脱敏,再按分隔符拆回"""
+        # 相同文本(表头、模板字段等)只处理一次;不含候选字符的段落原样保留
+        candidates = list(dict.fromkeys(
+            text for text in texts if self.deidentifier.has_candidates(text)))
+        
+        if len(candidates) > _PARALLEL_MIN_SEGMENTS:
+            # 段落较多时分块交给线程池;回写文档树仍在主线程串行进行
+            size = -(-len(candidates) // _PARALLEL_WORKERS)
+            chunks = [candidates[i:i + size] for i in range(0, len(candidates), size)]
+            with ThreadPoolExecutor(max_workers=_PARALLEL_WORKERS) as executor:
+                masked = [text for chunk in executor.map(self._mask_chunk, chunks)
+                          for text in chunk]
+        else:
+            masked = self._mask_chunk(candidates)
+        
+        masked_by_text = dict(zip(candidates, masked))
+        return [masked_by_text.get(text, text) for text in texts]
+    
+    def _mask_chunk(self, texts):
+        """拼接一组文本一次性脱敏,再按分隔符拆回"""
+        masked = self.deidentifier.process_text(_SEGMENT_SEP.join(texts)).split(_SEGMENT_SEP)
+        if len(masked) != len(texts):
+            # 分隔符被规则吞掉时退回逐段处理
+            masked = [self.deidentifier._cached_process(text) for text in texts]
+        return masked
+    
+    def _process_paragraphs(self, paragraphs, new_texts):
+        """回写段落(只改写有变化的段落,原地修改文本节点以保留格式)"""
+        for para, new_text in zip(paragraphs, new_texts):
+            self._write_paragraph(para, new_text)
+    
+    def _write_paragraph(self, para, new_text):
+        """把脱敏后的文本写回单个段落(只改写被脱敏的片段,原文冒号保持原样)"""
+        old_text = para.text
+        new_text = _restore_colons(old_text, new_text)
+        if new_text == old_text:
+            return
+        
+        # 优先直接改写 w:t 节点,按原长度切分,未变化的节点不动
+        t_nodes = para._p.findall('.//' + _W_T)
+        t_texts = [t.text or '' for t in t_nodes]
+        if t_texts and ''.join(t_texts) == old_text:
+            for t, old, piece in zip(t_nodes, t_texts, _split_by_runs(t_texts, new_text)):
+                if piece != old:
+                    t.text = piece
+                    if piece != piece.strip():
+                        t.set(_XML_SPACE, 'preserve')
+            return
+        
+        # 含制表符/换行等非 w:t 内容时按 run 改写
+        runs = para.runs
+        run_texts = [run.text for run in runs]
+        if run_texts and ''.join(run_texts) == old_text:
+            for run, piece in zip(runs, _split_by_runs(run_texts, new_text)):
+                run.text = piece
+            return
+        
+        # 段落中含超链接等非run内容时,清空后整段重建
+        # 保存原始格式
+        original_runs = [(run.text, run.font.size, run.font.bold, 
+                        run.font.italic, run.font.name) 
+                       for run in para.runs]
+        
+        # 清除段落内容
+        para.clear()
+        
+        # 重新添加文本(保持格式)
+        run = para.add_run(new_text)
+        if original_runs:
+            run.font.size = original_runs[0][1]
+            run.font.bold = original_runs[0][2]
+            run.font.italic = original_runs[0][3]
+            if original_runs[0][4]:
+                run.font.name = original_runs[0][4]
+    
+    def _process_tables(self, cells, new_texts):
+        """回写表格单元格(按段落逐个原地改写,不整格重建)"""
+        for cell, new_text in zip(cells, new_texts):
+            old_text = cell.text
+            new_text = _restore_colons(old_text, new_text)
+            if new_text == old_text:
+                continue
+            
+            paras = cell.paragraphs
+            lines = new_text.split('\n')
+            if len(lines) == len(paras):
+                for para, line in zip(paras, lines):
+                    self._write_paragraph(para, line)
+            else:
+                cell.text = new_text
+    
+    def _save_document(self, doc):
+        """保存文档: 只重新序列化被修改的正文部件,其余部件从原文件逐项复制"""
+        main_part = doc.part
+        member = main_part.partname.membername  # word/document.xml
+        
+        # 先整体读入原文件,输出路径与输入相同时也能安全覆盖
+        source = io.BytesIO(self.input_file.read_bytes())
+        with zipfile.ZipFile(source) as zin, zipfile.ZipFile(self.output_file, 'w') as zout:
+            for info in zin.infolist():
+                if info.filename == member:
+                    zout.writestr(info, main_part.blob)
+                else:
+                    # 沿用原条目的压缩方式(ZIP_STORED/ZIP_DEFLATED)
+                    zout.writestr(info, zin.read(info))
     
     def _print_results(self):
         """打印处理结果"""
@@ -14,16 +14,65 @@ Author: ltesla
 
 import re
 import sys
+import copy
+import zipfile
 from pathlib import Path
+from lxml import etree
 from docx import Document
 from docx.shared import Pt, RGBColor, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.opc.constants import NAMESPACE, RELATIONSHIP_TARGET_MODE, RELATIONSHIP_TYPE
+from docx.opc.packuri import PackURI
 from docx.oxml.ns import qn
+from docx.oxml.parser import element_class_lookup
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+
+# 正文中段落/表格元素的标签
+_P_TAG = qn('w:p')
+_TBL_TAG = qn('w:tbl')
+_BODY_TAG = qn('w:body')
+_RELATIONSHIP_TAG = '{%s}Relationship' % NAMESPACE.OPC_RELATIONSHIPS
+# 流式读取正文时的分块大小
+_XML_CHUNK_SIZE = 1 << 16
+# 报告排版用到的颜色/字号(不可变对象,模块级共用)
+_DARK_BLUE = RGBColor(0, 0, 139)
+_NAVY = RGBColor(0, 0, 128)
+_GRAY = RGBColor(128, 128, 128)
+_DARK_GRAY = RGBColor(70, 70, 70)
+_BLACK = RGBColor(0, 0, 0)
+_PT_3 = Pt(3)
+_PT_6 = Pt(6)
+_PT_9 = Pt(9)
+_PT_10 = Pt(10)
+_PT_10_5 = Pt(10.5)
+_PT_11 = Pt(11)
+_PT_12 = Pt(12)
+_PT_18 = Pt(18)
+_INDENT = Inches(0.3)
+
+# 段落内的 run 元素
+_R_TAG = qn('w:r')
+
+
+def _main_document_member(package):
+    """按包关系 _rels/.rels 找到主文档部件在 zip 中的成员名(与 Document() 的定位方式一致)"""
+    for rel in etree.fromstring(package.read('_rels/.rels')).iterchildren(_RELATIONSHIP_TAG):
+        if (rel.get('Type') == RELATIONSHIP_TYPE.OFFICE_DOCUMENT
+                and rel.get('TargetMode') != RELATIONSHIP_TARGET_MODE.EXTERNAL):
+            return PackURI.from_rel_ref('/', rel.get('Target')).membername
+    raise KeyError('文档包中没有主文档部件')
 
 
 class ConsultationMasker:
     """会诊记录数据脱敏处理器"""
     
+    # 出生日期中提取年份(YYYY-MM-DD 等格式 / 8位数字格式)。
+    # 仅供本类的 mask_text 使用;实际运行的 _consult_mask_text(文件末尾)直接从合并正则的分组取年份
+    _YEAR_RE = re.compile(r'(\d{4})[-/年]?\d{1,2}[-/月]?\d{1,2}')
+    _YEAR8_RE = re.compile(r'(\d{4})\d{4}')
+    
     def __init__(self):
         """初始化"""
         # 敏感信息匹配模式
@@ -155,9 +204,9 @@ class ConsultationMasker:
         def replace_birth_date(match):
             full_match = match.group(0)
             # 提取年份
-            year_match = re.search(r'(\d{4})[-/年]?\d{1,2}[-/月]?\d{1,2}', full_match)
+            year_match = self._YEAR_RE.search(full_match)
             if not year_match:
-                year_match = re.search(r'(\d{4})\d{4}', full_match)  # 8位格式
+                year_match = self._YEAR8_RE.search(full_match)  # 8位格式
             if year_match:
                 year = year_match.group(1)
                 label = full_match.split('：')[0] if '：' in full_match else full_match.split(':')[0]
@@ -181,6 +230,20 @@ class ConsultationMasker:
 class ConsultationRecordSplitter:
     """会诊记录分页处理器"""
     
+    # 会诊科室 / 会诊时间
+    _INVITE_RE = re.compile(r'兹邀请\s*([^\s]+?)\s*医师会诊')
+    _TIME_RE = re.compile(r'时间[:：]\s*(\d{4}年\d{1,2}月\d{1,2}日\d{1,2}时\d{1,2}分)')
+    
+    # 会诊内容逐行切分: 含章节标题关键词的行归为section, 其余非空行归为body;
+    # 首尾空白不计入分组, 空行及仅含 | + - 的行不产生匹配
+    _SECTION_KEYWORDS = '|'.join(['病情摘要', '诊疗情况', '会诊记录', '会诊意见', '诊断意见',
+                                  '治疗意见', '用药情况', '检查结果'])
+    _CONTENT_RE = re.compile(
+        r'^(?![^\S\n]*[|+-]?[^\S\n]*$)[^\S\n]*'
+        rf'(?:(?P<section>[^\n]*?(?:{_SECTION_KEYWORDS})[^\n]*?)|(?P<body>[^\n]*?\S[^\n]*?))'
+        r'[^\S\n]*$',
+        re.MULTILINE)
+    
     def __init__(self, input_file, output_file=None, enable_masking=True):
         """
         初始化
@@ -201,92 +264,109 @@ class ConsultationRecordSplitter:
         self.enable_masking = enable_masking
         self.masker = ConsultationMasker() if enable_masking else None
     
+    def _iter_body_blocks(self):
+        """
+        流式读取主文档部件(一般为 word/document.xml), 依次生成正文下的段落和表格
+        
+        解析器与python-docx一致, 段落/表格对象的文本结果与Document()相同;
+        每个元素处理完后即释放, 内存占用不随文档大小增长
+        """
+        parser = etree.XMLPullParser(events=('end',), tag=(_P_TAG, _TBL_TAG),
+                                     remove_blank_text=True, resolve_entities=False)
+        parser.set_element_class_lookup(element_class_lookup)
+        
+        with zipfile.ZipFile(self.input_file) as package, \
+                package.open(_main_document_member(package)) as stream:
+            while True:
+                chunk = stream.read(_XML_CHUNK_SIZE)
+                if chunk:
+                    parser.feed(chunk)
+                else:
+                    parser.close()
+                for _, element in parser.read_events():
+                    # 表格单元格内的段落/嵌套表格随所在表格一起处理
+                    body = element.getparent()
+                    if body is None or body.tag != _BODY_TAG:
+                        continue
+                    
+                    if element.tag == _P_TAG:
+                        yield Paragraph(element, None)
+                    else:
+                        yield Table(element, None)
+                    
+                    # 释放已处理的元素
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del body[0]
+                if not chunk:
+                    break
+    
     def extract_and_parse_from_docx(self):
         """直接从Word文档中按段落和表格解析会诊记录"""
         try:
-            doc = Document(self.input_file)
-            
             consultations = []
             current_consultation = None
             current_content = []
             
             # 遍历文档所有元素(段落和表格)
-            for element in doc.element.body:
+            for block in self._iter_body_blocks():
                 # 处理段落
-                if element.tag.endswith('p'):
-                    para = None
-                    for p in doc.paragraphs:
-                        if p._element == element:
-                            para = p
-                            break
+                if isinstance(block, Paragraph):
+                    text = block.text.strip()
                     
-                    if para:
-                        text = para.text.strip()
-                        
-                        # 检测会诊记录开始
-                        if '院内会诊申请及记录单' in text or '会诊申请及记录单' in text or '会诊记录单' in text:
-                            # 保存上一条会诊记录
-                            if current_consultation and current_content:
-                                current_consultation['content'] = '\n'.join(current_content)
-                                if self.enable_masking:
-                                    current_consultation['content'] = self.masker.mask_patient_name(current_consultation['content'])
-                                    current_consultation['content'] = self.masker.mask_doctors(current_consultation['content'])
-                                    current_consultation['content'] = self.masker.mask_text(current_consultation['content'])
-                                consultations.append(current_consultation)
-                            
-                            # 开始新的会诊记录
-                            current_consultation = {
-                                'title': '院内会诊申请及记录单',
-                                'dept': '未指定',
-                                'time': '未记录',
-                                'content': '',
-                                'raw_content': ''
-                            }
-                            current_content = []
+                    # 检测会诊记录开始
+                    if '院内会诊申请及记录单' in text or '会诊申请及记录单' in text or '会诊记录单' in text:
+                        # 保存上一条会诊记录
+                        if current_consultation and current_content:
+                            current_consultation['content'] = '\n'.join(current_content)
+                            if self.enable_masking:
+                                # mask_text 内部已完成姓名和医生的脱敏
+                                current_consultation['content'] = self.masker.mask_text(current_consultation['content'])
+                            consultations.append(current_consultation)
                         
-                        # 收集内容
-                        if current_consultation and text:
-                            current_content.append(text)
+                        # 开始新的会诊记录
+                        current_consultation = {
+                            'title': '院内会诊申请及记录单',
+                            'dept': '未指定',
+                            'time': '未记录',
+                            'content': '',
+                            'raw_content': ''
+                        }
+                        current_content = []
+                    
+                    # 收集内容
+                    if current_consultation and text:
+                        current_content.append(text)
                 
                 # 处理表格
-                elif element.tag.endswith('tbl'):
-                    if current_consultation:
-                        # 提取表格内容
-                        table = None
-                        for t in doc.tables:
-                            if t._element == element:
-                                table = t
-                                break
+                elif current_consultation:
+                    # 提取表格内容
+                    for row in block.rows:
+                        row_text = []
+                        for cell in row.cells:
+                            # cell.text 每次访问都会重新拼接,只取一次
+                            cell_text = cell.text
+                            if not cell_text or cell_text.isspace():
+                                continue
+                            row_text.append(cell_text.strip())
+                            
+                            # 识别会诊科室
+                            dept_match = self._INVITE_RE.search(cell_text)
+                            if dept_match:
+                                current_consultation['dept'] = dept_match.group(1).strip()
+                            
+                            # 识别会诊时间
+                            time_match = self._TIME_RE.search(cell_text)
+                            if time_match:
+                                current_consultation['time'] = time_match.group(1)
                         
-                        if table:
-                            for row in table.rows:
-                                row_text = []
-                                for cell in row.cells:
-                                    cell_text = cell.text.strip()
-                                    if cell_text:
-                                        row_text.append(cell_text)
-                                        
-                                        # 识别会诊科室
-                                        if '兹邀请' in cell_text:
-                                            dept_match = re.search(r'兹邀请\s*([^\s]+?)\s*医师会诊', cell_text)
-                                            if dept_match:
-                                                current_consultation['dept'] = dept_match.group(1).strip()
-                                        
-                                        # 识别会诊时间
-                                        if '时间：' in cell_text or '时间:' in cell_text:
-                                            time_match = re.search(r'时间[:：]\s*(\d{4}年\d{1,2}月\d{1,2}日\d{1,2}时\d{1,2}分)', cell_text)
-                                            if time_match:
-                                                current_consultation['time'] = time_match.group(1)
-                                
-                                if row_text:
-                                    current_content.append(' | '.join(row_text))
+                        if row_text:
+                            current_content.append(' | '.join(row_text))
             
             # 保存最后一条记录
             if current_consultation and current_content:
                 current_consultation['content'] = '\n'.join(current_content)
                 if self.enable_masking:
-                    current_consultation['content'] = self.masker.mask_patient_name(current_consultation['content'])
-                    current_consultation['content'] = self.masker.mask_doctors(current_consultation['content'])
                     current_consultation['content'] = self.masker.mask_text(current_consultation['content'])
                 consultations.append(current_consultation)
             
@@ -322,13 +402,11 @@ class ConsultationRecordSplitter:
             dept = dept_match.group(1).strip() if dept_match else "未指定科室"
             
             # 提取会诊时间
-            time_match = re.search(r'时间[:：]\s*(\d{4}年\d{1,2}月\d{1,2}日\d{1,2}时\d{1,2}分)', content)
+            time_match = self._TIME_RE.search(content)
             consult_time = time_match.group(1) if time_match else "未记录时间"
             
             # 脱敏处理
             if self.enable_masking:
-                content = self.masker.mask_patient_name(content)
-                content = self.masker.mask_doctors(content)
                 content = self.masker.mask_text(content)
             
             consultations.append({
@@ -375,7 +453,7 @@ class ConsultationRecordSplitter:
         style = doc.styles['Normal']
         font = style.font
         font.name = '宋体'
-        font.size = Pt(10.5)
+        font.size = _PT_10_5
         style.element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
     
     def _add_consultation_page(self, doc, consultation, page_num, total_pages):
@@ -404,10 +482,10 @@ class ConsultationRecordSplitter:
         title = doc.add_paragraph()
         title.alignment = WD_ALIGN_PARAGRAPH.CENTER
         title_run = title.add_run(title_text)
-        title_run.font.size = Pt(18)
+        title_run.font.size = _PT_18
         title_run.font.bold = True
         title_run.font.name = '黑体'
-        title_run.font.color.rgb = RGBColor(0, 0, 139)
+        title_run.font.color.rgb = _DARK_BLUE
         title_run._element.rPr.rFonts.set(qn('w:eastAsia'), '黑体')
     
     def _add_privacy_notice(self, doc):
@@ -415,16 +493,16 @@ class ConsultationRecordSplitter:
         notice = doc.add_paragraph()
         notice.alignment = WD_ALIGN_PARAGRAPH.CENTER
         notice_run = notice.add_run("(本记录已进行隐私保护处理)")
-        notice_run.font.size = Pt(9)
+        notice_run.font.size = _PT_9
         notice_run.font.italic = True
-        notice_run.font.color.rgb = RGBColor(128, 128, 128)
+        notice_run.font.color.rgb = _GRAY
     
     def _add_separator(self, doc, char='─', length=60):
         """添加分隔线"""
         para = doc.add_paragraph(char * length)
         para.alignment = WD_ALIGN_PARAGRAPH.CENTER
         run = para.runs[0]
-        run.font.color.rgb = RGBColor(128, 128, 128)
+        run.font.color.rgb = _GRAY
     
     def _add_consultation_info(self, doc, consultation):
         """添加会诊基本信息"""
@@ -432,22 +510,22 @@ class ConsultationRecordSplitter:
         dept_para = doc.add_paragraph()
         dept_label = dept_para.add_run("会诊科室: ")
         dept_label.font.bold = True
-        dept_label.font.size = Pt(12)
+        dept_label.font.size = _PT_12
         
         dept_value = dept_para.add_run(consultation['dept'])
-        dept_value.font.size = Pt(12)
+        dept_value.font.size = _PT_12
         dept_value.font.bold = True
-        dept_value.font.color.rgb = RGBColor(0, 0, 128)
+        dept_value.font.color.rgb = _NAVY
         
         # 会诊时间
         time_para = doc.add_paragraph()
         time_label = time_para.add_run("会诊时间: ")
         time_label.font.bold = True
-        time_label.font.size = Pt(11)
+        time_label.font.size = _PT_11
         
         time_value = time_para.add_run(consultation['time'])
-        time_value.font.size = Pt(11)
-        time_value.font.color.rgb = RGBColor(70, 70, 70)
+        time_value.font.size = _PT_11
+        time_value.font.color.rgb = _DARK_GRAY
         
         # 添加空行
         doc.add_paragraph()
@@ -457,46 +535,55 @@ class ConsultationRecordSplitter:
         # 内容标题
         content_title = doc.add_paragraph()
         content_title_run = content_title.add_run('会诊内容:')
-        content_title_run.font.size = Pt(11)
+        content_title_run.font.size = _PT_11
         content_title_run.font.bold = True
         content_title_run.font.underline = True
         
         # 分段显示内容
         content = consultation['content']
         
-        # 按段落分割
-        paragraphs = content.split('\n')
-        
         current_section = None
-        for para_text in paragraphs:
-            para_text = para_text.strip()
-            if not para_text or para_text in ['|', '+', '-']:
+        # 每类段落第一次按格式逐项生成,之后复制其XML只替换文本
+        templates = {}
+        body = doc.element.body
+        for m in self._CONTENT_RE.finditer(content):
+            # 按匹配分组区分章节标题与普通内容
+            is_section = m.lastgroup == 'section'
+            para_text = m.group(m.lastgroup)
+            template = templates.get(is_section)
+            if template is not None:
+                p = copy.deepcopy(template)
+                # 按 run 整体重写(只保留 rPr),模板中的制表符/换行及其后的文本节点不会残留
+                p.find(_R_TAG).text = para_text
+                body._insert_p(p)
+                if is_section:
+                    current_section = para_text
                 continue
             
-            # 检查是否为章节标题
-            if any(keyword in para_text for keyword in 
-                   ['病情摘要', '诊疗情况', '会诊记录', '会诊意见', '诊断意见', 
-                    '治疗意见', '用药情况', '检查结果']):
+            if is_section:
                 # 章节标题
                 section_para = doc.add_paragraph()
-                section_para.paragraph_format.space_before = Pt(6)
-                section_para.paragraph_format.space_after = Pt(3)
+                section_para.paragraph_format.space_before = _PT_6
+                section_para.paragraph_format.space_after = _PT_3
                 
                 section_run = section_para.add_run(para_text)
-                section_run.font.size = Pt(11)
+                section_run.font.size = _PT_11
                 section_run.font.bold = True
-                section_run.font.color.rgb = RGBColor(0, 0, 128)
+                section_run.font.color.rgb = _NAVY
                 
+                templates[True] = section_para._p
                 current_section = para_text
             else:
                 # 普通内容
                 para = doc.add_paragraph()
-                para.paragraph_format.left_indent = Inches(0.3)
-                para.paragraph_format.space_after = Pt(3)
+                para.paragraph_format.left_indent = _INDENT
+                para.paragraph_format.space_after = _PT_3
                 
                 run = para.add_run(para_text)
-                run.font.size = Pt(10)
-                run.font.color.rgb = RGBColor(0, 0, 0)
+                run.font.size = _PT_10
+                run.font.color.rgb = _BLACK
+                
+                templates[False] = para._p
     
     def _add_footer(self, doc, page_num, total_pages):
         """添加页脚信息"""
@@ -508,9 +595,9 @@ class ConsultationRecordSplitter:
         
         footer_text = f"第 {page_num} / {total_pages} 页"
         footer_run = footer.add_run(footer_text)
-        footer_run.font.size = Pt(9)
+        footer_run.font.size = _PT_9
         footer_run.font.italic = True
-        footer_run.font.color.rgb = RGBColor(128, 128, 128)
+        footer_run.font.color.rgb = _GRAY
     
     def process(self):
         """执行完整的处理流程"""
@@ -598,8 +685,53 @@ def main():
 
 
 # === Unified de-identification patch per user policy ===
+import bisect as _bisect
+import functools as _functools
 from collections import OrderedDict as _OrderedDict
 
+# mask_text normalizes full-width colons first; the patterns below match ':' only
+_COLON_TABLE = str.maketrans({'：': ':'})
+
+# 个别模式需要额外的匹配标志,其余按默认标志预编译
+_CONSULT_PATTERN_FLAGS = {
+    'other_ids': re.IGNORECASE,
+    'generic_id': re.IGNORECASE | re.MULTILINE,
+    'address_field': re.MULTILINE,
+}
+
+_CONSULT_DOCTOR_RES = [
+    re.compile(r'会诊医生签名:\s*([\u4e00-\u9fa5]{2,6})'),
+    re.compile(r'医生签名:\s*([\u4e00-\u9fa5]{2,6})'),
+    re.compile(r'(?:请会诊医师|会诊医师):\s*([\u4e00-\u9fa5]{2,6})'),
+]
+# explicit patient-name labels; the names behind them are also masked where they stand alone
+_CONSULT_PATIENT_NAME_RE = re.compile(r'(?:患者姓名|姓名)[:：]\s*([\u4e00-\u9fa5]{2,4})')
+_CONSULT_EXAM_RE = re.compile(r'((?:检查号|放射检查号|检验单号|化验单号|检验号|报告单号|单号|病理号|标本号|编号|病理单号|报告流水号|流水号|条码号|条码|访问号|接入号):\s*)[\w\-_/\.]+')
+# a text without any of these characters (or the first character of a mapped doctor)
+# cannot match any masking rule: digits/colons for labelled fields and ids, 号 and I/N for
+# generic ids, 院/所/心 for hospital suffixes, and the inline address landmark characters
+_CONSULT_TRIGGER_CHARS = '0123456789:：号IiNn院所心路街巷弄里村屯组庄湾苑区厦场楼寓'
+
+# patterns merged into alternations, in the order they used to be applied. The code labels
+# take [\w...]+ values that run on into CJK text, so they get their own later pass:
+# in one alternation '检查号：CT001出生日期：...' would swallow the birth-date label
+_CONSULT_COMBINED_KEYS = ('id_card', 'admission_no', 'phone', 'birth_date')
+_CONSULT_CODE_KEYS = ('exam_all', 'other_ids', 'generic_id')
+_CONSULT_INLINE_FLAGS = {'other_ids': 'i', 'generic_id': 'im'}
+
+_CONSULT_ADDR_LANDMARK = r'(?:路|街|巷|弄|里|村|屯|组|庄|湾|苑|小区|社区|园区|大厦|广场|写字楼|公寓)'
+# inline address: optional province/city/district prefix, a stretch ending in a landmark, house no.
+# (?=(?P<x>...))(?P=x) matches the prefix atomically, so a failed landmark search no longer
+# retries every province/city/district split (exponential on long CJK runs)
+_CONSULT_INLINE_ADDR = (
+    r'(?:(?=(?P<addr_prefix>(?:[一-龥]{2,30}(?:省|自治区|特别行政区))?(?:[一-龥]{2,30}(?:市|州|盟))?(?:[一-龥]{2,30}(?:区|县|旗|镇|乡|街道|开发区|新区))?))(?P=addr_prefix)'
+    r'[一-龥0-9]{0,40}' + _CONSULT_ADDR_LANDMARK +
+    r'|[一-龥0-9]{0,40}' + _CONSULT_ADDR_LANDMARK + r')'
+    r'[一-龥0-9\-]{0,40}(?:\d{1,4}号)?[一-龥0-9\-]{0,20}(?:(?:楼|幢|栋|单元|室|房)\d{0,6})?'
+)
+
+_CONSULT_ADDR_PREFIX_RE = re.compile(r'^\s*([一-龥]{2,30}(?:省|自治区|特别行政区))?\s*([一-龥]{2,30}(?:市|州|盟))?\s*([一-龥]{2,30}(?:区|县|旗))?\s*([一-龥]{2,30}(?:镇|乡|街道|开发区|新区))?\s*')
+
 _Consult_orig_init = ConsultationMasker.__init__
 
 def _consult_init(self, mask_mode='remove'):
@@ -609,38 +741,62 @@ def _consult_init(self, mask_mode='remove'):
     self.doctor_counter = 0
     self.hospital_mapping = _OrderedDict()
     self.hospital_counter = 0
+    # doctor names kept longest-first as they are identified; the alternation
+    # built from it is dropped on every insert and rebuilt lazily
+    self._doctor_ordered = []
+    self._doctor_re = None
+    # trigger-character pre-check, rebuilt when doctor_mapping grows
+    self._trigger_re = None
+    self._trigger_len = 0
     # disable city masking patterns by removing if exists
     self.patterns.pop('city', None)
     # keep gender/age
     self.patterns.pop('gender', None)
     self.patterns.pop('age_simple', None)
     self.patterns.pop('age_in_text', None)
+    self.patterns['admission_no'] = r'(?:住院号|入院号|病案号):\s*[\dA-Z\-]+'
     # strengthen id card
     self.patterns['id_card'] = r'\b\d{15}\b|\b\d{17}[\dXx]\b'
     # DOB keep year only
-    self.patterns['birth_date'] = r'((?:出生日期|生日|出生)[:：]\s*)(?:\D*)?((?:19|20)\d{2})(?:\d{2}(?:\d{2})?|[-/年]\d{1,2}[-/月]\d{1,2}日?)?'
+    self.patterns['birth_date'] = r'((?:出生日期|生日|出生):\s*)(?:\D*)?((?:19|20)\d{2})(?:\d{2}(?:\d{2})?|[-/年]\d{1,2}[-/月]\d{1,2}日?)?'
     # hospitals (existing pattern ok) -> map to hospital A/B...
     # detailed address masking patterns
-    self.patterns.setdefault('address_field', r'((?:地址|住址|现住址|家庭住址|联系地址|单位地址|通讯地址|户籍地址|居住地址)[:：]\s*)(.+)$')
-    self.patterns.setdefault('inline_addr', r'(?:(?:[一-龥]{2,30}(?:省|自治区|特别行政区))?(?:[一-龥]{2,30}(?:市|州|盟))?(?:[一-龥]{2,30}(?:区|县|旗|镇|乡|街道|开发区|新区))?)?[一-龥0-9]{0,40}(?:路|街|巷|弄|里|村|屯|组|庄|湾|苑|小区|社区|园区|大厦|广场|写字楼|公寓)[一-龥0-9\-]{0,40}(?:\d{1,4}号)?[一-龥0-9\-]{0,20}(?:(?:楼|幢|栋|单元|室|房)\d{0,6})?')
+    self.patterns.setdefault('address_field', r'((?:地址|住址|现住址|家庭住址|联系地址|单位地址|通讯地址|户籍地址|居住地址):\s*)(.+)$')
+    self.patterns.setdefault('inline_addr', _CONSULT_INLINE_ADDR)
     # other ids & generic ids
-    self.patterns.setdefault('other_ids', r'((?:门诊号|就诊号|就诊卡号|诊疗卡号|医保号|社保号|社会保障号|医疗保险号|费用单号|发票号|单据号|结算单号|交易号|支付单号|对账单号|电子病历号|病历号|EMR号|EMPI|MPI|HIS号|LIS号|RIS号|PACS号|系统号|主索引号|统一编号|UID|标识号|患者ID|患者编号|条码号|条码|条形码|报告流水号|流水号|报告号|报告编号|访问号|接入号|Accession\s*No\.?|Study\s*ID)[:：]\s*)[\w\-_/\.]+')
-    self.patterns.setdefault('generic_id', r'(^|\s)((?:[A-Za-z]{2,8}\s*)?(?:ID|No\.?|NO\.?|编号|号码|号|序列号|流水号)[:：]?\s*)([A-Za-z0-9][A-Za-z0-9\-_/.]{7,})')
-    # patient name patterns per report
+    self.patterns.setdefault('other_ids', r'((?:门诊号|就诊号|就诊卡号|诊疗卡号|医保号|社保号|社会保障号|医疗保险号|费用单号|发票号|单据号|结算单号|交易号|支付单号|对账单号|电子病历号|病历号|EMR号|EMPI|MPI|HIS号|LIS号|RIS号|PACS号|系统号|主索引号|统一编号|UID|标识号|患者ID|患者编号|条码号|条码|条形码|报告流水号|流水号|报告号|报告编号|访问号|接入号|Accession\s*No\.?|Study\s*ID):\s*)[\w\-_/\.]+')
+    self.patterns.setdefault('generic_id', r'(^|\s)((?:[A-Za-z]{2,8}\s*)?(?:ID|No\.?|NO\.?|编号|号码|号|序列号|流水号):?\s*)([A-Za-z0-9][A-Za-z0-9\-_/.]{7,})')
+    # patient name patterns per report (label in group 1, name in group 2)
     self._name_patterns = [
-        r'(?:姓名|患者|病人|患者姓名)[:：]\s*([\u4e00-\u9fa5]{2,6})',
-        r'(?:患者)[:：]\s*([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',
+        r'((?:姓名|患者|病人|患者姓名)[:：]\s*)([\u4e00-\u9fa5]{2,6})',
+        r'((?:患者)[:：]\s*)([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',
     ]
+    # 所有模式在初始化时编译一次,脱敏时直接使用编译结果
+    self._compiled = {k: re.compile(v, _CONSULT_PATTERN_FLAGS.get(k, 0)) for k, v in self.patterns.items()}
+    self._name_res = [re.compile(p) for p in self._name_patterns]
+    # standalone patient-name matchers, compiled once per name
+    self._patient_name_res = {}
+    # fixed-format identifiers scanned as alternations, dispatched on lastgroup
+    sources = dict(self.patterns, exam_all=_CONSULT_EXAM_RE.pattern)
+    self._combined = _consult_alternation(sources, _CONSULT_COMBINED_KEYS)
+    self._codes = _consult_alternation(sources, _CONSULT_CODE_KEYS)
+    # per-line caches for the pure (mapping-free) substitution phases
+    self._mask_ids_cached = _functools.lru_cache(maxsize=4096)(lambda line: _consult_mask_ids(self, line))
+    self._mask_addr_cached = _functools.lru_cache(maxsize=4096)(
+        lambda line: _consult_mask_addresses(self, _consult_mask_codes(self, line)))
+
+def _consult_alternation(sources, keys):
+    parts = []
+    for key in keys:
+        flags = _CONSULT_INLINE_FLAGS.get(key)
+        body = f'(?{flags}:{sources[key]})' if flags else sources[key]
+        parts.append(f'(?P<{key}>{body})')
+    return re.compile('|'.join(parts))
 
 def _consult_identify_doctors(self, text):
-    doctor_patterns = [
-        r'会诊医生签名[:：]\s*([\u4e00-\u9fa5]{2,6})',
-        r'医生签名[:：]\s*([\u4e00-\u9fa5]{2,6})',
-        r'(?:请会诊医师|会诊医师)[:：]\s*([\u4e00-\u9fa5]{2,6})',
-    ]
     exclude_words = {'主任','副主任','主治','住院','记录日期','签名日期','记录内容','书写日期'}
-    for pat in doctor_patterns:
-        for m in re.finditer(pat, text):
+    for pat in _CONSULT_DOCTOR_RES:
+        for m in pat.finditer(text):
             name = m.group(1)
             if not name or name in exclude_words or len(name) < 2:
                 continue
@@ -648,78 +804,156 @@ def _consult_identify_doctors(self, text):
                 self.doctor_counter += 1
                 suffix = chr(64 + self.doctor_counter) if self.doctor_counter <= 26 else str(self.doctor_counter)
                 self.doctor_mapping[name] = f'doctor{suffix}'
+                _bisect.insort(self._doctor_ordered, (-len(name), name))
+                self._doctor_re = None
 
-def _consult_mask_names(self, text):
-    for pat in self._name_patterns:
-        for m in re.finditer(pat, text):
-            original = m.group(0)
-            name = m.group(1)
-            if self.mask_mode == 'remove':
-                text = text.replace(original, '')
-            elif self.mask_mode == 'asterisk':
-                if len(name) == 2:
-                    masked_name = name[0] + '*'
-                else:
-                    masked_name = name[0] + '*' * (len(name) - 1)
-                text = text.replace(original, original.replace(name, masked_name))
-            else:
-                # placeholder
-                text = re.sub(re.escape(name), '[患者姓名]', text, count=1)
+# remove / placeholder use fixed templates expanded by sre, no Python callback
+_CONSULT_NAME_REMOVE = ''
+_CONSULT_NAME_PLACEHOLDER = r'\1[患者姓名]'
+
+def _consult_name_repl(self, m):
+    # asterisk: keep the label and the surname
+    name = m.group(2)
+    return m.group(1) + name[0] + '*' * (len(name) - 1)
+
+def _consult_mask_names(self, text, patient_name=None):
+    names = _CONSULT_PATIENT_NAME_RE.findall(text)
+    if patient_name:
+        names.append(patient_name)
+    if self.mask_mode == 'remove':
+        repl = _CONSULT_NAME_REMOVE
+    elif self.mask_mode == 'asterisk':
+        repl = lambda m: _consult_name_repl(self, m)
+    else:
+        repl = _CONSULT_NAME_PLACEHOLDER
+    for pat in self._name_res:
+        text = pat.sub(repl, text)
+    for name in dict.fromkeys(names):
+        text = _consult_mask_standalone_name(self, text, name)
     return text
 
+def _consult_mask_standalone_name(self, text, name):
+    # the same name elsewhere in the text, but only where it is not part of a longer CJK run
+    name_re = self._patient_name_res.get(name)
+    if name_re is None:
+        name_re = re.compile(rf'(?<![\u4e00-\u9fa5]){re.escape(name)}(?![\u4e00-\u9fa5])')
+        self._patient_name_res[name] = name_re
+    if self.mask_mode == 'remove':
+        masked = ''
+    elif self.mask_mode == 'asterisk':
+        masked = name[0] + '*' * (len(name) - 1)
+    else:
+        masked = '[患者姓名]'
+    return name_re.sub(lambda m: masked, text)
+
 def _consult_mask_doctors(self, text):
-    # replace all identified doctor names
-    for k, v in sorted(self.doctor_mapping.items(), key=lambda x: len(x[0]), reverse=True):
-        text = text.replace(k, v)
-    return text
+    # replace all identified doctor names in a single scan (longest name first)
+    if not self._doctor_ordered:
+        return text
+    if self._doctor_re is None:
+        self._doctor_re = re.compile('|'.join(re.escape(k) for _, k in self._doctor_ordered))
+    return self._doctor_re.sub(lambda m: self.doctor_mapping[m.group(0)], text)
+
+def _consult_combined_repl(self, m):
+    kind = m.lastgroup
+    # capture groups of the matched sub-pattern follow its named group
+    g = m.re.groupindex[kind]
+    if kind == 'id_card':
+        return '[身份证号已脱敏]'
+    if kind == 'admission_no':
+        if self.mask_mode == 'placeholder':
+            return m.group(g).split(':')[0] + ':[住院号]'
+        return '' if self.mask_mode == 'remove' else '住院号:***'
+    if kind == 'phone':
+        # phone per report scheme
+        if self.mask_mode == 'remove':
+            return ''
+        if self.mask_mode == 'asterisk':
+            return m.group(g)[:3] + '****' + m.group(g)[-4:]
+        return '[手机号]'
+    if kind == 'birth_date':
+        # DOB keep year
+        return f"{m.group(g + 1)}{m.group(g + 2)}"
+    if kind == 'generic_id':
+        return f"{m.group(g + 1)}{m.group(g + 2)}CODE"
+    # exam/lab/pathology + other ids
+    return f"{m.group(g + 1)}CODE"
+
+def _consult_map_hospital(self, m):
+    h = m.group(0)
+    if h not in self.hospital_mapping:
+        self.hospital_counter += 1
+        suffix = chr(64 + self.hospital_counter) if self.hospital_counter <= 26 else str(self.hospital_counter)
+        self.hospital_mapping[h] = f"hospital {suffix}"
+    return self.hospital_mapping[h]
+
+def _consult_mask_ids(self, line):
+    # ids / admission no / phone / DOB in one scan
+    return self._combined.sub(lambda m: _consult_combined_repl(self, m), line)
+
+def _consult_mask_codes(self, line):
+    # exam/lab/pathology codes and other ids, after the labelled ids and hospitals are masked
+    return self._codes.sub(lambda m: _consult_combined_repl(self, m), line)
+
+def _consult_mask_detail(addr: str) -> str:
+    if not addr:
+        return '[地址已脱敏]'
+    m = _CONSULT_ADDR_PREFIX_RE.match(addr)
+    prefix = ''.join([p for p in (m.groups() if m else []) if p])
+    return f"{prefix}[地址已脱敏]"
+
+def _consult_mask_addresses(self, line):
+    # detailed address keep city/admin, mask rest
+    line = self._compiled['address_field'].sub(lambda m: f"{m.group(1)}{_consult_mask_detail(m.group(2))}", line)
+    return self._compiled['inline_addr'].sub('[地址已脱敏]', line)
+
+def _consult_split_units(text):
+    # split into lines for the caches, keeping a line that ends in a label colon
+    # together with the next one (the value may follow a line break)
+    units = []
+    pending = None
+    for line in text.split('\n'):
+        if pending is not None:
+            line = pending + '\n' + line
+        if line.rstrip().endswith(':'):
+            pending = line
+            continue
+        pending = None
+        units.append(line)
+    if pending is not None:
+        units.append(pending)
+    return units
+
+def _consult_has_candidates(self, text):
+    if self._trigger_re is None or self._trigger_len != len(self.doctor_mapping):
+        chars = set(_CONSULT_TRIGGER_CHARS)
+        chars.update(name[0] for name in self.doctor_mapping)
+        self._trigger_re = re.compile('[%s]' % ''.join(re.escape(c) for c in sorted(chars)))
+        self._trigger_len = len(self.doctor_mapping)
+    return self._trigger_re.search(text) is not None
 
 def _consult_mask_text(self, text):
     if not text:
         return text
-    masked_text = text
+    # pure narrative without trigger characters: nothing to mask
+    if not _consult_has_candidates(self, text):
+        return text
+    masked_text = text.translate(_COLON_TABLE)
     masked_text = _consult_mask_names(self, masked_text)
     _consult_identify_doctors(self, masked_text)
-    masked_text = re.sub(self.patterns['id_card'], '[身份证号已脱敏]', masked_text)
-    masked_text = re.sub(self.patterns['admission_no'], lambda m: m.group(0).split('：')[0].split(':')[0] + ':[住院号]' if self.mask_mode=='placeholder' else ('' if self.mask_mode=='remove' else '住院号:***'), masked_text)
-    # phone per report scheme
-    if 'phone' in self.patterns:
-        if self.mask_mode == 'remove':
-            masked_text = re.sub(self.patterns['phone'], '', masked_text)
-        elif self.mask_mode == 'asterisk':
-            masked_text = re.sub(self.patterns['phone'], lambda m: m.group(0)[:3]+'****'+m.group(0)[-4:], masked_text)
-        else:
-            masked_text = re.sub(self.patterns['phone'], '[手机号]', masked_text)
-    # DOB keep year
-    masked_text = re.sub(self.patterns['birth_date'], lambda m: f"{m.group(1)}{m.group(2)}", masked_text)
-    # hospital mapping
-    for h in re.findall(self.patterns['hospital'], masked_text):
-        if h not in self.hospital_mapping:
-            self.hospital_counter += 1
-            suffix = chr(64 + self.hospital_counter) if self.hospital_counter <= 26 else str(self.hospital_counter)
-            self.hospital_mapping[h] = f"hospital {suffix}"
-    for k, v in sorted(self.hospital_mapping.items(), key=lambda x: len(x[0]), reverse=True):
-        masked_text = masked_text.replace(k, v)
-    # exam/lab/pathology + other ids
-    masked_text = re.sub(r'((?:检查号|放射检查号|检验单号|化验单号|检验号|报告单号|单号|病理号|标本号|编号|病理单号|报告流水号|流水号|条码号|条码|访问号|接入号)[:：]\s*)[\w\-_/\.]+', r'\1CODE', masked_text)
-    masked_text = re.sub(self.patterns.get('other_ids', r'$^'), lambda m: f"{m.group(1)}CODE", masked_text, flags=re.IGNORECASE)
-    masked_text = re.sub(self.patterns.get('generic_id', r'$^'), lambda m: f"{m.group(1)}{m.group(2)}CODE", masked_text, flags=re.IGNORECASE|re.MULTILINE)
-    # detailed address keep city/admin, mask rest
-    def _mask_detail(addr: str) -> str:
-        if not addr:
-            return '[地址已脱敏]'
-        prefix_pat = re.compile(r'^\s*([一-龥]{2,30}(?:省|自治区|特别行政区))?\s*([一-龥]{2,30}(?:市|州|盟))?\s*([一-龥]{2,30}(?:区|县|旗))?\s*([一-龥]{2,30}(?:镇|乡|街道|开发区|新区))?\s*')
-        m = prefix_pat.match(addr)
-        prefix = ''.join([p for p in (m.groups() if m else []) if p])
-        return f"{prefix}[地址已脱敏]"
-    masked_text = re.sub(self.patterns.get('address_field', r'$^'), lambda m: f"{m.group(1)}{_mask_detail(m.group(2))}", masked_text, flags=re.MULTILINE)
-    masked_text = re.sub(self.patterns.get('inline_addr', r'$^'), '[地址已脱敏]', masked_text)
+    # pure phases run line by line through the caches (boilerplate lines repeat across consultations)
+    masked_text = '\n'.join(map(self._mask_ids_cached, _consult_split_units(masked_text)))
+    # hospital mapping, assigned while substituting
+    masked_text = self._compiled['hospital'].sub(lambda m: _consult_map_hospital(self, m), masked_text)
+    # codes, then addresses
+    masked_text = '\n'.join(map(self._mask_addr_cached, _consult_split_units(masked_text)))
     masked_text = _consult_mask_doctors(self, masked_text)
     return masked_text
 
 ConsultationMasker.__init__ = _consult_init
 ConsultationMasker.mask_text = _consult_mask_text
 ConsultationMasker.mask_doctors = _consult_mask_doctors
-ConsultationMasker.mask_patient_name = lambda self, text, patient_name=None: _consult_mask_names(self, text)
+ConsultationMasker.mask_patient_name = lambda self, text, patient_name=None: _consult_mask_names(self, text, patient_name)
 
 
 
@@ -22,10 +22,188 @@ from docx.shared import Pt, RGBColor, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import qn
 
+# 正文段落元素标签
+_P_TAG = qn('w:p')
+
+# 可选: 安装 pyahocorasick 后,医生/医院名称替换改用 Aho-Corasick 自动机(与名称数量无关的线性扫描)
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+# 医院名称的全部结尾词(patterns['hospital'] 中其余结尾均以"医院"结束),用于跳过不含医院名的文本
+_HOSPITAL_SUFFIXES = ('医院', '卫生院', '卫生所', '诊所', '医疗中心')
+
+
+def _has_hospital_suffix(text):
+    """文本中是否出现医院名称结尾词"""
+    return any(suffix in text for suffix in _HOSPITAL_SUFFIXES)
+
+
+# 病程记录起点: 行首时间戳 / 行首记录类型标题(可带序号和**加粗**标记)
+_RECORD_KEYWORDS = [
+    '转科（转入）记录','转科（转出）记录','转科(入)记录','转科(出)记录','转科（入）记录','转科（出）记录','危重病例副主任医师查房记录','危重病例主治医师查房记录','危重病例查房记录','主治医师查房记录','副主任医师查房记录','主任医师查房记录','危重病例主任医师查房记录','输血前记录','输血前评估','输血评估','输血前检查','危急值记录','危急值报告','危急值通知','危急值病程记录','术前评估','术前小结','术前讨论','手术风险评估表','术后首次病程记录','术后首次病程','术后记录','术后评估','手术风险评估表','手术记录','麻醉记录','麻醉术前访视','麻醉术前评估','会诊记录','抢救记录','转科记录','转入记录','转出记录','死亡记录','入院记录','出院记录'
+]
+_DATETIME_LINE_RE = re.compile(r'(?m)^\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}')
+_KEYWORD_LINE_RE = re.compile(r'(?m)^(?:\s*(?:\d+[\)）\.、]|[一二三四五六七八九十]+[、\.])\s*)?(?:\*\*)?(%s)(?:\*\*)?\s*[:：]?' % '|'.join(map(re.escape, _RECORD_KEYWORDS)))
+
+# 记录开头的时间戳 / 正文中**加粗**的记录类型
+_LEADING_DATETIME_RE = re.compile(r'^(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2})\s*(.*)$', re.DOTALL)
+_BOLD_TYPE_RE = re.compile(r'\*\*([^*]+)\*\*')
+# 以序号开头的小标题行
+_NUMBERED_LINE_RE = re.compile(r'^[一二三四五六七八九十\d]+[、．\.]')
+# 标题之后仅剩"书写日期/记录内容/签名"等字段名(无正文)
+_TEMPLATE_FIELDS_RE = re.compile(r'(\s*(书写日期|记录内容|医生签名|医师签名|签名)[:：]?\s*)?')
+
+# 记录类型比较前的归一化: 全角括号/全角空格 → 半角; 连续空白压缩为一个空格
+_TYPE_NORM_TABLE = str.maketrans({'（': '(', '）': ')', '　': ' '})
+_WHITESPACE_RUN_RE = re.compile(r'\s+')
+
+
+def _norm_type(t: str) -> str:
+    """记录类型归一化(全角括号/空格转半角)"""
+    if not t:
+        return ''
+    return t.translate(_TYPE_NORM_TABLE).strip()
+
+
+def _is_title_only(rec) -> bool:
+    """记录内容是否只有标题/模板字段而无实质内容"""
+    t = _norm_type(rec.get('type', ''))
+    c = (rec.get('content') or '').strip()
+    if not t:
+        return False
+    c_norm = c.replace('\r', '').strip()
+    # 非常短且只包含标题/少量模板词
+    if len(c_norm) == 0:
+        return True
+    # 只包含标题（可能重复一次）
+    if _norm_type(c_norm) == t:
+        return True
+    # 标题 + 书写日期/记录内容 这类模板字段（无实质内容）
+    if len(c_norm) <= 120:
+        tmp = _WHITESPACE_RUN_RE.sub(' ', c_norm)
+        tmp_norm = _norm_type(tmp)
+        if tmp_norm == t:
+            return True
+        if tmp_norm.startswith(t) and all(k in tmp_norm for k in []):
+            return True
+        # 仅包含标题 + “书写日期/记录内容/签名”等字段名但无正文
+        if tmp_norm.startswith(t) and _TEMPLATE_FIELDS_RE.fullmatch(tmp_norm, len(t)):
+            return True
+    return False
+
+
+def _merge_title_only_records(records):
+    """
+    合并“仅包含块标题/模板字段”的碎片记录：常见于 转科/危急值/术前术后/输血/风险评估 等
+    
+    规则：当前块无时间戳且内容极短，且内容基本等于标题（或只包含标题/书写日期等），则并入下一块并继承其时间戳
+    
+    records 可以是任意可迭代对象,只向后看一条记录,逐条生成合并后的记录
+    """
+    cur = None
+    for nxt in records:
+        if cur is not None and not _merge_into_next(cur, nxt):
+            yield cur
+        cur = nxt
+    # 最后一条没有后继,原样保留
+    if cur is not None:
+        yield cur
+
+
+def _merge_into_next(cur, nxt):
+    """cur 为仅含标题的碎片时并入 nxt 并返回 True,否则不做修改返回 False"""
+    if cur.get('datetime') != '无时间戳':
+        return False
+    cur_type = _norm_type(cur.get('type', ''))
+    if not cur_type or not _is_title_only(cur):
+        return False
+    
+    # 让下一块继承标题类型；同时避免把标题重复插入内容
+    nxt_type = _norm_type(nxt.get('type', ''))
+    # 仅当下一块类型是默认“病程记录/无类型”时才覆盖，避免误改已明确类型
+    if (not nxt_type) or (nxt_type in ('病程记录', '查房记录', '记录', '病程')):
+        nxt['type'] = cur.get('type', nxt.get('type'))
+    # 若下一块内容开头没有标题，则把标题作为首行补进去（但不重复）
+    nxt_content = (nxt.get('content') or '').lstrip()
+    if not _norm_type(nxt_content[:len(cur_type) + 4]).startswith(cur_type):
+        nxt['content'] = (cur_type + '\n' + nxt_content).strip()
+    return True
+
+
+def _bulk_replace(text, spans):
+    """按 (起点, 终点, 替换文本) 依次替换互不重叠的片段,片段收集到列表后一次拼接"""
+    parts = []
+    pos = 0
+    for start, end, replacement in spans:
+        parts.append(text[pos:start])
+        parts.append(replacement)
+        pos = end
+    if not parts:
+        return text
+    parts.append(text[pos:])
+    return ''.join(parts)
+
+
+def _build_replacer(mapping):
+    """
+    将 名称→替换文本 的映射构建为替换函数,一次扫描完成全部替换
+    
+    同一位置优先替换最长的名称;未安装 pyahocorasick 时用按长度降序排列的正则多选分支
+    """
+    if not mapping:
+        return None
+    
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for name, replacement in mapping.items():
+            automaton.add_word(name, (len(name), replacement))
+        automaton.make_automaton()
+        
+        # iter_long 给出的是匹配末尾下标(含)
+        return lambda text: _bulk_replace(
+            text, ((end - length + 1, end + 1, replacement)
+                   for end, (length, replacement) in automaton.iter_long(text)))
+    
+    names = sorted(mapping, key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(name) for name in names))
+    return lambda text: pattern.sub(lambda m: mapping[m.group(0)], text)
+
 
 class UnifiedMedicalMasker:
     """统一的医疗数据脱敏处理器"""
     
+    # 无字段名的"姓名，男/女，xx岁"写法(全角逗号/半角逗号/空格分隔)
+    _BARE_NAME_RES = (
+        re.compile(r'(?<![\u4e00-\u9fff])([\u4e00-\u9fff]{2,4})(?=，\s*(男|女)\s*，\s*\d{1,3}岁)'),
+        re.compile(r'(?<![\u4e00-\u9fff])([\u4e00-\u9fff]{2,4})(?=,\s*(男|女)\s*,\s*\d{1,3}岁)'),
+        re.compile(r'(?<![\u4e00-\u9fff])([\u4e00-\u9fff]{2,4})(?=\s+(男|女)\s+\d{1,3}岁)'),
+    )
+    # 患者姓名强信号字段: 字段名开头 / 抬头"姓名 男,xx岁"
+    _PATIENT_FIELD_RES = (
+        re.compile(r'(?:^|\n|\r)(?:\s*)(?:姓名|患者姓名|病人姓名|患者|病人)[:：\s]+([\u4e00-\u9fa5]{2,4})(?=\s|\n|\r|$|，|,|；|;|\t)'),
+        re.compile(r'(?:^|\n|\r)(?:\s*)([\u4e00-\u9fa5]{2,4})(?=\s*(?:男|女)\s*[，,]\s*\d{1,3}岁)'),
+    )
+    # 通用患者姓名字段
+    _NAME_FIELD_RE = re.compile(r'(?:姓名|患者)[:：]\s*[\u4e00-\u9fa5]{2,4}')
+    # 地址中的省/市/区县前缀
+    _ADDRESS_PREFIX_RE = re.compile(r'^\s*([一-龥]{2,30}(?:省|自治区|特别行政区))?\s*([一-龥]{2,30}(?:市|州|盟))?\s*([一-龥]{2,30}(?:区|县|旗))?\s*')
+    # 典型的医学表达(地址误判排除)
+    _MEDICAL_CONTEXT_RES = tuple(re.compile(p) for p in (
+        r'病理.*?提示', r'免疫.*?化', r'切片', r'染色',
+        r'检查.*?示', r'辅助', r'测定', r'检验',
+        r'\([+\-]\)', r'阴性|阳性', r'克隆号'
+    ))
+    # 第一个时间戳(其前为抬头)
+    _FIRST_DATETIME_RE = re.compile(r'\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}')
+    # mask_text 合并扫描的规则
+    _COMBINED_KEYS = ('id_card', 'admission_no', 'birth_date_full', 'birth_date_short', 'phone')
+    # 单号的值 [\w\-_/]+ 会连同后面的中文一起匹配,合并扫描时会吞掉紧跟的出生日期/住院号字段名,
+    # 因此在上面的规则之后单独扫描
+    _CODE_KEYS = ('exam_codes', 'other_codes')
+    
     def __init__(self):
         """初始化"""
         # 医生姓名映射 (来自medical_record_splitter_modified_v6.py)
@@ -40,7 +218,13 @@ class UnifiedMedicalMasker:
         
         
         self.title_hospitals = []
-        self.main_hospital_label = None# 敏感信息匹配模式
+        self.main_hospital_label = None
+        # 医生/医院名称替换函数,映射变化时置空,使用时重建
+        self._doctor_replacer = None
+        self._hospital_replacer = None
+        # mask_all 中姓名字段/医生姓名的合并正则,医生映射变化时置空
+        self._person_re = None
+        # 敏感信息匹配模式
         self.patterns = {
             # 身份证号 - 统一使用medical_report_splitter_with_mask.py的方案(更简洁)
             'id_card': r'\b\d{15}|\d{17}[\dXx]\b',
@@ -100,26 +284,44 @@ class UnifiedMedicalMasker:
             'S-100', 'SOX-10', 'PNL2', 'MiTF', 'Red-KI-67',
             '克隆号', '正常着色', '阴性', '阳性'
         ]
+        
+        # 预编译匹配模式(地址字段按行匹配)
+        self._res = {name: re.compile(p) for name, p in self.patterns.items()}
+        self._res['address_field'] = re.compile(self.patterns['address_field'], re.MULTILINE)
+        self._name_res = [re.compile(p) for p in self.name_patterns]
+        self._doctor_res = [re.compile(p) for p in self.doctor_patterns]
+        # 医学术语白名单合并为一个忽略大小写的正则,一次扫描判断是否命中任一术语
+        self._whitelist_re = re.compile(
+            '|'.join(re.escape(term) for term in self.medical_terms_whitelist), re.IGNORECASE)
+        
+        # 身份证/住院号/出生日期/手机号合并为一个命名分组交替式,各类单号合并为另一个,
+        # mask_text 中各一次扫描完成替换(按原处理顺序排列分组)
+        self._combined_re = re.compile('|'.join(
+            f'(?P<{name}>{self.patterns[name]})' for name in self._COMBINED_KEYS))
+        self._codes_re = re.compile('|'.join(
+            f'(?P<{name}>{self.patterns[name]})' for name in self._CODE_KEYS))
     
     def identify_patient_names(self, text):
         """从强信号字段中提取患者姓名候选,用于全局精确替换"""
         if not text:
             return
         # 仅依赖字段名/抬头结构信号,不做语义猜测
-        pats = [
-            r'(?:^|\n|\r)(?:\s*)(?:姓名|患者姓名|病人姓名|患者|病人)[:：\s]+([\u4e00-\u9fa5]{2,4})(?=\s|\n|\r|$|，|,|；|;|\t)',
-            r'(?:^|\n|\r)(?:\s*)([\u4e00-\u9fa5]{2,4})(?=\s*(?:男|女)\s*[，,]\s*\d{1,3}岁)',  # 抬头常见: 姓名 男,xx岁
-        ]
-        for p in pats:
-            for m in re.finditer(p, text):
+        for p in self._PATIENT_FIELD_RES:
+            for m in p.finditer(text):
                 nm = (m.group(1) or '').strip()
                 if 2 <= len(nm) <= 4:
                     self.patient_names.add(nm)
 
+    def scan_document(self, text):
+        """整篇文档的识别阶段: 医生姓名、医院名称、患者姓名"""
+        self.identify_doctors(text)
+        self.identify_hospitals(text)
+        self.identify_patient_names(text)
+    
     def identify_doctors(self, text):
         """识别文本中所有的医生姓名"""
-        for pattern in self.doctor_patterns:
-            matches = re.finditer(pattern, text)
+        for pattern in self._doctor_res:
+            matches = pattern.finditer(text)
             for match in matches:
                 doctor_name = match.group(1)
                 
@@ -139,27 +341,23 @@ class UnifiedMedicalMasker:
                     self.doctor_counter += 1
                     suffix = chr(64 + self.doctor_counter) if self.doctor_counter <= 26 else str(self.doctor_counter)
                     self.doctor_mapping[doctor_name] = f'doctor{suffix}'
+                    self._doctor_replacer = None
+                    self._person_re = None
     
     def identify_hospitals(self, text):
-        title_text = text
-        m = re.search(r'\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}', text)
-        if m:
-            title_text = text[:m.start()]
-        title_matches = re.findall(self.patterns['hospital'], title_text)
-        seen = set()
-        self.title_hospitals = []
-        for h in title_matches:
-            if h not in seen:
-                seen.add(h)
-                self.title_hospitals.append(h)
-
-        all_matches = re.findall(self.patterns['hospital'], text)
-        all_seen = set()
-        all_hospitals = []
-        for h in all_matches:
-            if h not in all_seen:
-                all_seen.add(h)
-                all_hospitals.append(h)
+        # 第一个时间戳之前为抬头
+        m = self._FIRST_DATETIME_RE.search(text)
+        title_end = m.start() if m else len(text)
+        
+        # 不含任何医院结尾词时不可能匹配,跳过正则扫描
+        matches = []
+        if _has_hospital_suffix(text):
+            matches = list(self._res['hospital'].finditer(text))
+        
+        # 医院名称只含汉字,不会越过时间戳的首位数字,
+        # 因此抬头中的医院即全文扫描中起点位于时间戳之前的匹配,无需再单独扫描抬头
+        self.title_hospitals = list(dict.fromkeys(mm.group(0) for mm in matches if mm.start() < title_end))
+        all_hospitals = list(dict.fromkeys(mm.group(0) for mm in matches))
 
         self.hospital_mapping.clear()
         self.hospital_counter = 0
@@ -177,13 +375,15 @@ class UnifiedMedicalMasker:
             self.hospital_counter += 1
             suffix = chr(ord('A') + self.hospital_counter - 1) if self.hospital_counter <= 26 else str(self.hospital_counter)
             self.hospital_mapping[h] = f'hospital {suffix}'
+        
+        self._hospital_replacer = None
     
     def mask_patient_name(self, text, patient_name=None):
         """替换患者姓名为 patient (统一使用medical_report_splitter方案)"""
         # 如果未提供患者姓名,尝试从文本中提取
         if not patient_name:
-            for pattern in self.name_patterns:
-                match = re.search(pattern, text)
+            for pattern in self._name_res:
+                match = pattern.search(text)
                 if match:
                     patient_name = match.group(1)
                     break
@@ -191,38 +391,40 @@ class UnifiedMedicalMasker:
         if patient_name:
             text = text.replace(patient_name, 'patient')
         
-        # 通用患者模式替换
-        text = re.sub(r'(?:姓名|患者)[:：]\s*[\u4e00-\u9fa5]{2,4}', 
-                     lambda m: m.group(0).rsplit('：', 1)[0].rsplit(':', 1)[0] + ':patient' 
-                     if ':' in m.group(0) else m.group(0).rsplit('：', 1)[0] + '：patient',
-                     text)
+        # 通用患者模式替换(文本中没有"姓名"/"患者"字样时不可能命中,跳过)
+        if '姓名' in text or '患者' in text:
+            text = self._NAME_FIELD_RE.sub(lambda m: self._mask_name_field(m.group(0)), text)
         
         return text
     
+    @staticmethod
+    def _mask_name_field(field):
+        """"姓名:张三"/"患者：张三" → 保留字段名及冒号形式,姓名换为 patient"""
+        if ':' in field:
+            return field.rsplit('：', 1)[0].rsplit(':', 1)[0] + ':patient'
+        return field.rsplit('：', 1)[0] + '：patient'
+    
     def mask_doctors(self, text):
         """替换医生姓名为 doctorA, doctorB等"""
-        sorted_doctors = sorted(self.doctor_mapping.items(), 
-                               key=lambda x: len(x[0]), 
-                               reverse=True)
+        if self._doctor_replacer is None:
+            self._doctor_replacer = _build_replacer(self.doctor_mapping)
+            if self._doctor_replacer is None:
+                return text
         
-        for doctor_name, replacement in sorted_doctors:
-            text = text.replace(doctor_name, replacement)
-        
-        return text
+        return self._doctor_replacer(text)
     
     def mask_hospitals(self, text):
-        if self.main_hospital_label:
-            text = text.replace('我院', self.main_hospital_label)
-            text = text.replace('本院', self.main_hospital_label)
-
-        sorted_hospitals = sorted(self.hospital_mapping.items(),
-                                  key=lambda x: len(x[0]),
-                                  reverse=True)
-
-        for hospital_name, replacement in sorted_hospitals:
-            text = text.replace(hospital_name, replacement)
-
-        return text
+        """替换医院名称为 hospital A/B/C, "我院"/"本院"替换为主医院"""
+        if self._hospital_replacer is None:
+            mapping = dict(self.hospital_mapping)
+            if self.main_hospital_label:
+                mapping.setdefault('我院', self.main_hospital_label)
+                mapping.setdefault('本院', self.main_hospital_label)
+            self._hospital_replacer = _build_replacer(mapping)
+            if self._hospital_replacer is None:
+                return text
+
+        return self._hospital_replacer(text)
     
     def mask_birth_date(self, text):
         """处理出生日期 - 只保留年份"""
@@ -232,7 +434,7 @@ class UnifiedMedicalMasker:
             label = match.group(0).split('：')[0].split(':')[0]
             return f"{label}：{year}年"
         
-        text = re.sub(self.patterns['birth_date_full'], replace_full_date, text)
+        text = self._res['birth_date_full'].sub(replace_full_date, text)
         
         # 处理短格式: 19800115 → 1980
         def replace_short_date(match):
@@ -241,30 +443,29 @@ class UnifiedMedicalMasker:
             label = match.group(0).split('：')[0].split(':')[0]
             return f"{label}：{year}年"
         
-        text = re.sub(self.patterns['birth_date_short'], replace_short_date, text)
+        text = self._res['birth_date_short'].sub(replace_short_date, text)
         
         return text
     
     def is_medical_context(self, text_before, text_after):
         """判断是否为医学术语上下文,避免误判为地址"""
-        # 检查前后文是否包含医学术语
-        context = (text_before + text_after).lower()
-        
-        # 检查是否包含医学术语白名单
-        for term in self.medical_terms_whitelist:
-            if term.lower() in context:
-                return True
-        
-        # 检查是否包含典型的医学表达
-        medical_patterns = [
-            r'病理.*?提示', r'免疫.*?化', r'切片', r'染色',
-            r'检查.*?示', r'辅助', r'测定', r'检验',
-            r'\([+\-]\)', r'阴性|阳性', r'克隆号'
-        ]
-        
-        for pattern in medical_patterns:
-            if re.search(pattern, context):
+        # 白名单术语和医学表达都不跨行,前后文拼接后的匹配只可能跨越交界处的那一行:
+        # 分为 前文除末行 / 交界行 / 后文除首行 三段分别检查,只拼接交界行
+        cut = text_before.rfind('\n') + 1
+        end = text_after.find('\n')
+        if end < 0:
+            end = len(text_after)
+        contexts = (text_before[:cut], text_before[cut:] + text_after[:end], text_after[end:])
+        
+        for context in contexts:
+            # 检查是否包含医学术语白名单(白名单中的英文标记物名不区分大小写)
+            if self._whitelist_re.search(context):
                 return True
+            
+            # 检查是否包含典型的医学表达
+            for pattern in self._MEDICAL_CONTEXT_RES:
+                if pattern.search(context):
+                    return True
         
         return False
     
@@ -276,8 +477,7 @@ class UnifiedMedicalMasker:
             addr = match.group(2).strip()
             
             # 提取省市区前缀
-            prefix_pat = re.compile(r'^\s*([一-龥]{2,30}(?:省|自治区|特别行政区))?\s*([一-龥]{2,30}(?:市|州|盟))?\s*([一-龥]{2,30}(?:区|县|旗))?\s*')
-            m = prefix_pat.match(addr)
+            m = self._ADDRESS_PREFIX_RE.match(addr)
             prefix = ''
             if m:
                 parts = [p for p in m.groups() if p]
@@ -286,13 +486,65 @@ class UnifiedMedicalMasker:
             return f"{label}{prefix}[详细地址已脱敏]"
         
         # 只替换明确的地址字段
-        text = re.sub(self.patterns['address_field'], 
-                     replace_address_field, 
-                     text, 
-                     flags=re.MULTILINE)
+        text = self._res['address_field'].sub(replace_address_field, text)
         
         return text
     
+    def _replace_combined(self, match):
+        """合并正则的替换回调,按命中的分组名分派"""
+        kind = match.lastgroup
+        # 子模式自身的捕获分组紧随其命名分组之后
+        g = match.re.groupindex[kind]
+        if kind == 'id_card':
+            return '[身份证号已脱敏]'
+        if kind == 'phone':
+            return '[手机号已脱敏]'
+        if kind in ('exam_codes', 'other_codes'):
+            return match.group(g + 1) + 'CODE'
+        label = match.group(kind).split('：')[0].split(':')[0]
+        if kind == 'admission_no':
+            return label + ':CODE'
+        # 出生日期只保留年份
+        year = match.group(g + 1)[:4]
+        return f"{label}：{year}年"
+    
+    def _person_pattern(self):
+        """姓名字段、医生姓名合并为一个正则(按原处理顺序排列分组)"""
+        if self._person_re is None:
+            parts = [f'(?P<field>{self._NAME_FIELD_RE.pattern})']
+            if self.doctor_mapping:
+                names = sorted(self.doctor_mapping, key=len, reverse=True)
+                parts.append('(?P<doctor>%s)' % '|'.join(re.escape(name) for name in names))
+            self._person_re = re.compile('|'.join(parts))
+        return self._person_re
+    
+    def _replace_person(self, match):
+        """合并姓名正则的替换回调"""
+        kind = match.lastgroup
+        if kind == 'field':
+            return self._mask_name_field(match.group(0))
+        return self.doctor_mapping[match.group(0)]
+    
+    def mask_all(self, text):
+        """
+        单条记录的完整脱敏,按 mask_patient_name / mask_doctors / mask_text 的顺序处理
+        
+        姓名字段和医生姓名在同一次扫描中替换,减少对记录文本的遍历次数;
+        无字段名的患者姓名在此之后由 mask_text 替换(其前一字符须按医生姓名替换后的文本判断)
+        """
+        if not text:
+            return text
+        
+        # 患者姓名(取第一个姓名字段)全文替换
+        for pattern in self._name_res:
+            match = pattern.search(text)
+            if match:
+                text = text.replace(match.group(1), 'patient')
+                break
+        
+        text = self._person_pattern().sub(self._replace_person, text)
+        return self.mask_text(text)
+    
     def mask_text(self, text):
         """对文本进行统一脱敏处理"""
         if not text:
@@ -302,40 +554,24 @@ class UnifiedMedicalMasker:
         
         # 额外覆盖：转科/转入转出等表格里常见的“姓名，男/女，xx岁”无字段名写法
         # 仅在紧跟性别与年龄的模式下替换，避免误伤普通名词（如“腮腺区”等）
-        masked_text = re.sub(r'(?<![\u4e00-\u9fff])([\u4e00-\u9fff]{2,4})(?=，\s*(男|女)\s*，\s*\d{1,3}岁)', 'patient', masked_text)
-        masked_text = re.sub(r'(?<![\u4e00-\u9fff])([\u4e00-\u9fff]{2,4})(?=,\s*(男|女)\s*,\s*\d{1,3}岁)', 'patient', masked_text)
-        masked_text = re.sub(r'(?<![\u4e00-\u9fff])([\u4e00-\u9fff]{2,4})(?=\s+(男|女)\s+\d{1,3}岁)', 'patient', masked_text)
+        for pattern in self._BARE_NAME_RES:
+            masked_text = pattern.sub('patient', masked_text)
 
-        # 1. 移除身份证号
-        masked_text = re.sub(self.patterns['id_card'], '[身份证号已脱敏]', masked_text)
-        
-        # 2. 移除住院号/病案号
-        masked_text = re.sub(self.patterns['admission_no'], 
-                            lambda m: m.group(0).split('：')[0].split(':')[0] + ':CODE',
-                            masked_text)
-        
-        # 3. 替换医院名称
+        return self._mask_fields(masked_text)
+    
+    def _mask_fields(self, masked_text):
+        """医院名称、各类编号/日期/手机号及详细地址的脱敏"""
+        # 1. 替换医院名称
         masked_text = self.mask_hospitals(masked_text)
         
-        # 4. 保留性别 - 不脱敏
-        # (不处理)
-        
-        # 5. 保留年龄 - 不脱敏
-        # (不处理)
-        
-        # 6. 处理出生日期 - 只保留年份
-        masked_text = self.mask_birth_date(masked_text)
-        
-        # 7. 移除手机号
-        masked_text = re.sub(self.patterns['phone'], '[手机号已脱敏]', masked_text)
+        # 2. 保留性别、年龄 - 不脱敏
         
-        # 8. 处理检验/检查/病理单号
-        masked_text = re.sub(self.patterns['exam_codes'], r'\1CODE', masked_text)
+        # 3. 身份证号、住院号/病案号、出生日期(只保留年份)、手机号一次扫描替换,
+        #    之后再扫描检验/检查/病理单号及其他编号
+        masked_text = self._combined_re.sub(self._replace_combined, masked_text)
+        masked_text = self._codes_re.sub(self._replace_combined, masked_text)
         
-        # 9. 处理其他编号
-        masked_text = re.sub(self.patterns['other_codes'], r'\1CODE', masked_text)
-        
-        # 10. 处理详细地址 (改进版,避免误判)
+        # 4. 处理详细地址 (改进版,避免误判)
         masked_text = self.mask_address(masked_text)
         
         return masked_text
@@ -368,138 +604,73 @@ class MedicalRecordSplitter:
         """从Word文档中提取文本(段落+表格)"""
         try:
             doc = Document(self.input_file)
-            parts = []
-            for para in doc.paragraphs:
-                if para.text is not None:
-                    parts.append(para.text)
-            for tbl in doc.tables:
-                for row in tbl.rows:
-                    for cell in row.cells:
-                        t = (cell.text or '').strip()
-                        if t:
-                            parts.append(t)
-            full_text = chr(10).join(parts)
-            return full_text
+            # 正文段落直接读取底层XML元素的文本,不再逐段构造 Paragraph 对象
+            parts = [p.text for p in doc.element.body.iterchildren(_P_TAG)]
+            # 表格单元格文本(去首尾空白,跳过空单元格)
+            cell_texts = (cell.text.strip() for tbl in doc.tables for row in tbl.rows for cell in row.cells)
+            parts.extend(t for t in cell_texts if t)
+            return '\n'.join(parts)
         except Exception as e:
             raise Exception(f"读取文档失败: {str(e)}")
     
     def parse_medical_records(self, text):
+        """解析全部病程记录,返回记录列表"""
+        return list(self.iter_medical_records(text))
+    
+    def iter_medical_records(self, text):
+        """
+        逐条生成病程记录(识别、脱敏及碎片合并均按记录依次进行)
+        
+        碎片合并只需向后看一条记录,调用方可边解析边消费,不必先持有全部记录
+        """
         if self.enable_masking:
-            self.masker.identify_doctors(text)
-            self.masker.identify_hospitals(text)
-            self.masker.identify_patient_names(text)
-
-        dt_pat = re.compile(r'(?m)^\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}')
-        kw = [
-            '转科（转入）记录','转科（转出）记录','转科(入)记录','转科(出)记录','转科（入）记录','转科（出）记录','危重病例副主任医师查房记录','危重病例主治医师查房记录','危重病例查房记录','主治医师查房记录','副主任医师查房记录','主任医师查房记录','危重病例主任医师查房记录','输血前记录','输血前评估','输血评估','输血前检查','危急值记录','危急值报告','危急值通知','危急值病程记录','术前评估','术前小结','术前讨论','手术风险评估表','术后首次病程记录','术后首次病程','术后记录','术后评估','手术风险评估表','手术记录','麻醉记录','麻醉术前访视','麻醉术前评估','会诊记录','抢救记录','转科记录','转入记录','转出记录','死亡记录','入院记录','出院记录'
-        ]
-        kw_pat = re.compile(r'(?m)^(?:\s*(?:\d+[\)）\.、]|[一二三四五六七八九十]+[、\.])\s*)?(?:\*\*)?(%s)(?:\*\*)?\s*[:：]?' % '|'.join(map(re.escape, kw)))
-
-        starts = []
-        for mm in dt_pat.finditer(text):
-            starts.append(mm.start())
-        for mm in kw_pat.finditer(text):
-            starts.append(mm.start())
-
-        starts = sorted(set(starts))
-        if not starts:
-            return []
-
-        records = []
-        for i, s in enumerate(starts):
-            e = starts[i+1] if i+1 < len(starts) else len(text)
+            self.masker.scan_document(text)
+
+        # 时间戳行与标题行的起点去重排序,相邻起点两两配对即为各记录的区间
+        # 时间戳必含"-"和":",两者缺一时跳过逐行扫描
+        starts = set()
+        if '-' in text and ':' in text:
+            starts.update(mm.start() for mm in _DATETIME_LINE_RE.finditer(text))
+        starts.update(mm.start() for mm in _KEYWORD_LINE_RE.finditer(text))
+        starts = sorted(starts)
+        ends = starts[1:]
+        ends.append(len(text))
+
+        # 合并“仅包含块标题/模板字段”的碎片记录
+        yield from _merge_title_only_records(self._iter_segments(text, starts, ends))
+
+    def _iter_segments(self, text, starts, ends):
+        """按记录区间切分文本,逐条生成(未合并的)记录"""
+        for s, e in zip(starts, ends):
             seg = text[s:e].strip()
             if not seg:
                 continue
 
             dt = ''
             content = seg
-            mdt = re.match(r'^(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2})\s*(.*)$', seg, flags=re.DOTALL)
+            mdt = _LEADING_DATETIME_RE.match(seg)
             if mdt:
                 dt = mdt.group(1).strip()
                 content = mdt.group(2).strip()
 
-            type_match = re.search(r'\*\*([^*]+)\*\*', content)
+            type_match = _BOLD_TYPE_RE.search(content)
             if type_match:
                 record_type = type_match.group(1).strip()
             else:
                 first_line = content.splitlines()[0].strip() if content else ''
-                mkw = kw_pat.match(first_line)
+                mkw = _KEYWORD_LINE_RE.match(first_line)
                 record_type = mkw.group(1).strip() if mkw else '病程记录'
 
             if self.enable_masking:
-                content = self.masker.mask_patient_name(content)
-                content = self.masker.mask_doctors(content)
-                content = self.masker.mask_text(content)
+                content = self.masker.mask_all(content)
 
-            records.append({
+            yield {
                 'datetime': dt if dt else '无时间戳',
                 'type': record_type,
                 'content': content,
                 'raw_content': seg
-            })
-
-                # 合并“仅包含块标题/模板字段”的碎片记录：常见于 转科/危急值/术前术后/输血/风险评估 等
-        # 规则：当前块无时间戳且内容极短，且内容基本等于标题（或只包含标题/书写日期等），则并入下一块并继承其时间戳
-        merged = []
-        i = 0
-
-        def _norm_type(t: str) -> str:
-            if not t:
-                return ''
-            return (t.replace('（', '(').replace('）', ')')
-                     .replace('　', ' ').strip())
-
-        def _is_title_only(rec) -> bool:
-            t = _norm_type(rec.get('type', ''))
-            c = (rec.get('content') or '').strip()
-            if not t:
-                return False
-            c_norm = c.replace('\r', '').strip()
-            # 非常短且只包含标题/少量模板词
-            if len(c_norm) == 0:
-                return True
-            # 只包含标题（可能重复一次）
-            if _norm_type(c_norm) == t:
-                return True
-            # 标题 + 书写日期/记录内容 这类模板字段（无实质内容）
-            if len(c_norm) <= 120:
-                tmp = re.sub(r'\s+', ' ', c_norm)
-                tmp_norm = _norm_type(tmp)
-                if tmp_norm == t:
-                    return True
-                if tmp_norm.startswith(t) and all(k in tmp_norm for k in []):
-                    return True
-                # 仅包含标题 + “书写日期/记录内容/签名”等字段名但无正文
-                if tmp_norm.startswith(t) and re.fullmatch(rf"{re.escape(t)}(\s*(书写日期|记录内容|医生签名|医师签名|签名)[:：]?\s*)?", tmp_norm):
-                    return True
-            return False
-
-        while i < len(records):
-            cur = records[i]
-            cur_type = _norm_type(cur.get('type', ''))
-            if cur.get('datetime') == '无时间戳' and cur_type and _is_title_only(cur) and i + 1 < len(records):
-                nxt = records[i + 1]
-                # 让下一块继承标题类型；同时避免把标题重复插入内容
-                nxt_type = _norm_type(nxt.get('type', ''))
-                # 仅当下一块类型是默认“病程记录/无类型”时才覆盖，避免误改已明确类型
-                if (not nxt_type) or (nxt_type in ('病程记录', '查房记录', '记录', '病程')):
-                    nxt['type'] = cur.get('type', nxt.get('type'))
-                # 若下一块内容开头没有标题，则把标题作为首行补进去（但不重复）
-                nxt_content = (nxt.get('content') or '').lstrip()
-                if cur_type and not _norm_type(nxt_content[:len(cur_type) + 4]).startswith(cur_type):
-                    joiner = chr(10)
-                    nxt['content'] = (cur_type + joiner + nxt_content).strip()
-                i += 1
-                continue
-
-            merged.append(cur)
-            i += 1
-
-        records = merged
-
+            }
 
-        return records
     def create_report_document(self):
         """创建分页报告文档"""
         print(f"正在创建新文档...")
@@ -656,7 +827,7 @@ class MedicalRecordSplitter:
             for k in subtitle_keywords:
                 if tt.startswith(k + '：') or tt.startswith(k + ':'):
                     return True
-            if re.match(r'^[一二三四五六七八九十\d]+[、．\.]', tt):
+            if _NUMBERED_LINE_RE.match(tt):
                 return True
             return False
 
@@ -722,6 +893,8 @@ class MedicalRecordSplitter:
             # 2. 解析病程记录
             print("正在解析病程记录...")
             self.records = self.parse_medical_records(text)
+            # 各记录已保存所需片段,全文不再需要,生成报告前释放
+            del text
             
             if not self.records:
                 raise Exception("未找到任何病程记录!请检查文档格式是否正确。")
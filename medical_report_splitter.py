@@ -13,18 +13,142 @@ Author: ltesla
 
 import re
 import sys
+import zipfile
 from pathlib import Path
 from collections import OrderedDict
 from docx import Document
-from docx.shared import Pt, RGBColor, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
-from docx.oxml.ns import qn
+from docx.shared import Pt, RGBColor
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.constants import NAMESPACE, RELATIONSHIP_TARGET_MODE, RELATIONSHIP_TYPE
+from docx.opc.packuri import PackURI
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from xml.sax.saxutils import escape
+
+# 可选: 安装 pyahocorasick 后,医院名称词典改用 Aho-Corasick 自动机匹配(与词典大小无关的线性扫描)
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# 可选: 安装 hyperscan 后,合并正则扫描前先用 Hyperscan 数据库预筛,不可能命中的文本直接跳过
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+
+# Python 正则里的 \uXXXX 写法,Hyperscan(PCRE 语法)需写成 \x{XXXX}
+_UNICODE_ESCAPE_RE = re.compile(r'\\u([0-9a-fA-F]{4})')
+
+# 检验项目: 【项目名称】(检验日期)内容
+_ITEM_RE = re.compile(r'【(?P<name>[^】]+)】\((?P<date>[0-9\-\s:]+)\)(?P<content>[^【]*)', re.DOTALL)
+_WHITESPACE_RUN_RE = re.compile(r'\s+')
+
+# 检验结果分隔符(中英文逗号、分号)
+_RESULT_SEP_RE = re.compile(r'[,，;；]')
+
+# 报告页 XML 片段: 段落属性与 python-docx 生成的一致(左缩进0.3英寸=432缇,段后3磅=60缇)
+_PPR_CENTER = '<w:pPr><w:jc w:val="center"/></w:pPr>'
+_PPR_RIGHT = '<w:pPr><w:jc w:val="right"/></w:pPr>'
+_PPR_RESULT = '<w:pPr><w:spacing w:after="60"/><w:ind w:left="432"/></w:pPr>'
+_PPR_CONTENT = '<w:pPr><w:spacing w:line="240" w:lineRule="auto"/><w:ind w:left="432"/></w:pPr>'
+_EMPTY_PARAGRAPH = '<w:p/>'
+_P_TAG = qn('w:p')
+_RELATIONSHIP_TAG = '{%s}Relationship' % NAMESPACE.OPC_RELATIONSHIPS
+_SECT_PR_TAG = qn('w:sectPr')
+_PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+# run 文本中需转成 <w:tab/>/<w:br/> 的字符
+_RUN_BREAK_RE = re.compile(r'([\t\r\n])')
+
+# 字段名与内容之间的冒号
+_COLON_RE = re.compile(r'[:：]')
+
+# 星号脱敏的姓名尾部,下标为被替换的字数
+_STAR_TAILS = ('', '*', '**', '***', '****', '*****', '******')
+
+# 占位符映射
+_PLACEHOLDERS = {
+    'id_card': '[身份证号]',
+    'admission_no': '住院号:[住院号]',
+    'hospital': '[医院名称]',
+    'gender': '性别:[性别]',
+    'age': '年龄:[年龄]',
+    'birth_date': '出生日期:[出生日期]',
+    'phone': '[手机号]',
+    'address': '地址:[地址]',
+}
+
+
+def _build_hyperscan_prefilter(patterns):
+    """
+    将正则列表编译为 Hyperscan 预筛函数: text -> 是否可能命中任一模式
+    
+    以 HS_FLAG_PREFILTER 编译(环视等不支持的语法按超集近似),只会误报、不会漏报,
+    最终的匹配与替换仍由 re 完成;未安装 hyperscan 或编译失败时返回 None
+    """
+    if hyperscan is None or not patterns:
+        return None
+    
+    # PCRE 不支持 (?a:...),去掉后按 Unicode 匹配,仍是原模式的超集
+    expressions = [_UNICODE_ESCAPE_RE.sub(r'\\x{\1}', p).replace('(?a:', '(?:').encode('utf-8')
+                   for p in patterns]
+    flags = (hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+             | hyperscan.HS_FLAG_PREFILTER | hyperscan.HS_FLAG_SINGLEMATCH)
+    db = hyperscan.Database()
+    try:
+        db.compile(expressions=expressions, ids=list(range(len(expressions))),
+                   elements=len(expressions), flags=[flags] * len(expressions))
+    except Exception:
+        return None
+    
+    def may_match(text):
+        hits = []
+        db.scan(text.encode('utf-8'), match_event_handler=lambda pattern_id, *_: hits.append(pattern_id))
+        return bool(hits)
+    
+    return may_match
+
+
+def _main_document_member(package):
+    """按包关系 _rels/.rels 找到主文档部件在 zip 中的成员名(与 Document() 的定位方式一致)"""
+    for rel in parse_xml(package.read('_rels/.rels')).iterchildren(_RELATIONSHIP_TAG):
+        if (rel.get('Type') == RELATIONSHIP_TYPE.OFFICE_DOCUMENT
+                and rel.get('TargetMode') != RELATIONSHIP_TARGET_MODE.EXTERNAL):
+            return PackURI.from_rel_ref('/', rel.get('Target')).membername
+    raise KeyError('文档包中没有主文档部件')
+
+
+def _run_xml(text, style_id):
+    """生成引用字符样式的 w:r 片段,制表符/换行的处理与 python-docx 的 add_run 相同"""
+    content = []
+    for piece in _RUN_BREAK_RE.split(text):
+        if piece == '\t':
+            content.append('<w:tab/>')
+        elif piece in ('\r', '\n'):
+            content.append('<w:br/>')
+        elif piece:
+            space = ' xml:space="preserve"' if len(piece.strip()) < len(piece) else ''
+            content.append(f'<w:t{space}>{escape(piece)}</w:t>')
+    return f'<w:r><w:rPr><w:rStyle w:val="{style_id}"/></w:rPr>{"".join(content)}</w:r>'
+
+
+def _paragraph_xml(ppr, *runs):
+    """生成 w:p 片段"""
+    return f'<w:p>{ppr}{"".join(runs)}</w:p>'
 
 
 class DataMasker:
     """数据脱敏处理器"""
     
-    def __init__(self, mask_mode='remove'):
+    # 各模式的字段名与医院结尾词;文本中一个都不含、也没有11位连续数字时,任何模式都不可能命中
+    _KEYWORDS = ('姓名', '患者', '病人', '住院号', '入院号', '病案号',
+                 '医院', '卫生院', '卫生所', '诊所', '医疗中心',
+                 '性别', '年龄', '出生', '生日', '地址', '住址')
+    # 身份证号(15/18位)和手机号(11位)都至少含11位连续数字
+    _DIGIT_RUN_RE = re.compile(r'\d{11}')
+    
+    def __init__(self, mask_mode='remove', hospital_dictionary=None):
         """
         初始化脱敏器
         
@@ -33,13 +157,17 @@ class DataMasker:
                 - 'remove': 完全移除敏感信息
                 - 'asterisk': 用星号替换 (如: 张** / 32010***********12)
                 - 'placeholder': 用占位符替换 (如: [患者姓名] / [身份证号])
+            hospital_dictionary: 已知医院名称列表(可选),提供时按词典精确识别医院名称,
+                不再使用宽泛的医院正则
         """
         self.mask_mode = mask_mode
+        self.hospital_dictionary = [name for name in (hospital_dictionary or ()) if name]
         
         # 敏感信息匹配模式
         self.patterns = {
-            # 身份证号: 18位或15位数字
-            'id_card': r'\b\d{15}|\d{17}[\dXx]\b',
+            # 身份证号: 18位或15位数字(先试18位;用数字环视代替\b,\b 在中文与数字之间不成立)
+            # 数字用半角/全角字符类,比 Unicode \d 的判断快,且仍能识别全角数字写的证件号
+            'id_card': r'(?<![0-9０-９])(?:[0-9０-９]{17}[0-9０-９Xx]|[0-9０-９]{15})(?![0-9０-９])',
             
             # 住院号: 常见格式 (可能需要根据实际情况调整)
             'admission_no': r'(?:住院号|入院号|病案号)[:：]\s*[\dA-Z\-]+',
@@ -56,11 +184,12 @@ class DataMasker:
             # 出生日期: YYYY-MM-DD 或 YYYY年MM月DD日
             'birth_date': r'(?:出生日期|生日|出生)[:：]\s*(?:\d{4}[-/年]\d{1,2}[-/月]\d{1,2}日?|\d{8})',
             
-            # 手机号: 11位数字
-            'phone': r'\b1[3-9]\d{9}\b',
+            # 手机号: 11位数字(号段 1[3-9] 本就只认半角,整体按 ASCII 匹配;同样用数字环视代替\b)
+            'phone': r'(?a:(?<!\d)1[3-9]\d{9}(?!\d))',
             
-            # 地址: "地址:"开头的内容
-            'address': r'(?:地址|住址|家庭住址)[:：][^\n]{5,50}',
+            # 地址: "地址:"开头的内容。冒号后可换行再接地址;内容不越过下一检验项目的"【",
+            # 也不吞掉后面另一个地址字段的标签(否则那个地址只剩"址:..."而不被识别)
+            'address': r'(?:地址|住址|家庭住址)[:：]\s*(?:(?![地住]址)[^\n【]){5,50}',
         }
         
         # 姓名识别需要特殊处理,因为姓名格式比较复杂
@@ -68,6 +197,48 @@ class DataMasker:
             r'(?:姓名|患者|病人)[:：]\s*([\u4e00-\u9fa5]{2,4})',  # 中文姓名
             r'(?:患者)[:：]\s*([A-Z][a-z]+(?:\s+[A-Z][a-z]+)?)',  # 英文姓名
         ]
+        
+        # 正则在首次脱敏时才编译,构造后(包括子类/补丁)对 patterns 的调整无需重复编译
+        self._combined_re = None
+    
+    def _compile_patterns(self):
+        """编译脱敏正则;首次脱敏时自动调用,之后修改 patterns/name_patterns 需重新调用"""
+        self._compiled_name_patterns = [re.compile(p) for p in self.name_patterns]
+        # 地址取冒号后整行内容,放进合并正则会按最左优先吞掉同一行后面的证件号/手机号开头,
+        # 因此不参与合并,在合并扫描之后单独再扫一遍(与原先逐条替换时地址最后处理一致)
+        patterns = {k: v for k, v in self.patterns.items() if k != 'address'}
+        address = self.patterns.get('address')
+        self._address_re = re.compile(address) if address else None
+        self._hospital_finder = None
+        if self.hospital_dictionary:
+            # 有医院名称词典时用词典匹配,合并正则中去掉医院模式
+            patterns = {k: v for k, v in patterns.items() if k != 'hospital'}
+            self._hospital_finder = self._build_hospital_finder(self.hospital_dictionary)
+        # 所有敏感信息模式合并为一个命名分组的交替式,单次扫描即可完成脱敏
+        self._combined_re = re.compile('|'.join(
+            f'(?P<{info_type}>{pattern})' for info_type, pattern in patterns.items()
+        ))
+        self._prefilter = _build_hyperscan_prefilter(list(patterns.values()))
+    
+    @staticmethod
+    def _build_hospital_finder(names):
+        """
+        将医院名称词典构建为查找函数: text -> [(起点, 终点, 名称), ...]
+        
+        同一位置取最长的名称,结果互不重叠;未安装 pyahocorasick 时用按长度降序排列的正则多选分支
+        """
+        if ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for name in names:
+                automaton.add_word(name, name)
+            automaton.make_automaton()
+            
+            # iter_long 给出的是匹配末尾下标(含)
+            return lambda text: [(end - len(name) + 1, end + 1, name)
+                                 for end, name in automaton.iter_long(text)]
+        
+        pattern = re.compile('|'.join(re.escape(name) for name in sorted(set(names), key=len, reverse=True)))
+        return lambda text: [(m.start(), m.end(), m.group(0)) for m in pattern.finditer(text)]
     
     def mask_text(self, text):
         """
@@ -78,104 +249,138 @@ class DataMasker:
             
         Returns:
             脱敏后的文本
+        
+        >>> DataMasker('placeholder').mask_text(
+        ...     '地址：北京市朝阳区建国路88号院3号楼2单元501室 联系电话：13812345678 身份证号：110105198001011234')
+        '[敏感信息]'
         """
         if not text:
             return text
         
+        if self._combined_re is None:
+            self._compile_patterns()
+        
+        # 快速预筛: 没有任何字段名/长数字串时跳过全部正则扫描,只需处理词典医院名
+        if not any(keyword in text for keyword in self._KEYWORDS) and not self._DIGIT_RUN_RE.search(text):
+            if self._hospital_finder is not None:
+                return self._mask_hospital_dictionary(text)
+            return text
+        
         masked_text = text
         
         # 1. 处理姓名 (需要先处理,避免被其他规则影响)
         masked_text = self._mask_names(masked_text)
         
-        # 2. 处理其他敏感信息
-        for info_type, pattern in self.patterns.items():
-            masked_text = self._mask_by_pattern(masked_text, pattern, info_type)
+        # 按词典识别医院名称
+        if self._hospital_finder is not None:
+            masked_text = self._mask_hospital_dictionary(masked_text)
+        
+        # 2. 处理其他敏感信息(合并正则单次扫描,按命中的分组名分派)
+        if self._prefilter is None or self._prefilter(masked_text):
+            masked_text = self._combined_re.sub(self._mask_match, masked_text)
+        
+        # 3. 地址(证件号/手机号已处理完,再整段替换)
+        if self._address_re is not None:
+            masked_text = self._address_re.sub(self._mask_address_match, masked_text)
         
         return masked_text
     
+    def _mask_match(self, match):
+        """合并正则的替换回调"""
+        return self._replacement_for(match, match.lastgroup)
+    
+    def _mask_address_match(self, match):
+        """地址正则的替换回调"""
+        return self._replacement_for(match, 'address')
+    
+    def _mask_hospital_dictionary(self, text):
+        """替换词典中命中的医院名称,片段收集到列表后一次拼接"""
+        parts = []
+        pos = 0
+        for start, end, name in self._hospital_finder(text):
+            parts.append(text[pos:start])
+            parts.append(self._mask_hospital_name(name))
+            pos = end
+        if not parts:
+            return text
+        parts.append(text[pos:])
+        return ''.join(parts)
+    
     def _mask_names(self, text):
         """识别并脱敏姓名"""
-        for pattern in self.name_patterns:
-            matches = re.finditer(pattern, text)
-            for match in matches:
-                original = match.group(0)
-                name = match.group(1)
-                
-                if self.mask_mode == 'remove':
-                    # 移除整行
-                    text = text.replace(original, '')
-                elif self.mask_mode == 'asterisk':
-                    # 保留姓,名字用*替换
-                    if len(name) == 2:
-                        masked_name = name[0] + '*'
-                    elif len(name) == 3:
-                        masked_name = name[0] + '**'
-                    elif len(name) == 4:
-                        masked_name = name[0] + '***'
-                    else:
-                        masked_name = name[0] + '*' * (len(name) - 1)
-                    
-                    masked = original.replace(name, masked_name)
-                    text = text.replace(original, masked)
-                elif self.mask_mode == 'placeholder':
-                    masked = re.sub(r'([:：]\s*)[^\s]+', r'\1[患者姓名]', original)
-                    text = text.replace(original, masked)
+        # 只改写匹配区间本身,避免 str.replace 误伤别处的相同文本
+        for pattern in self._compiled_name_patterns:
+            text = pattern.sub(self._name_repl, text)
         
         return text
     
-    def _mask_by_pattern(self, text, pattern, info_type):
-        """根据正则模式脱敏"""
-        matches = re.finditer(pattern, text)
-        
-        # 占位符映射
-        placeholders = {
-            'id_card': '[身份证号]',
-            'admission_no': '住院号:[住院号]',
-            'hospital': '[医院名称]',
-            'gender': '性别:[性别]',
-            'age': '年龄:[年龄]',
-            'birth_date': '出生日期:[出生日期]',
-            'phone': '[手机号]',
-            'address': '地址:[地址]',
-        }
+    def _name_repl(self, match):
+        """姓名正则的替换回调: 只替换分组1(姓名)所在区间,字段名原样保留"""
+        if self.mask_mode == 'remove':
+            # 移除整行
+            return ''
+        
+        name = match.group(1)
+        if self.mask_mode == 'asterisk':
+            # 保留姓,名字用*替换(常见长度直接查表)
+            tail_len = len(name) - 1
+            if tail_len < len(_STAR_TAILS):
+                masked_name = name[0] + _STAR_TAILS[tail_len]
+            else:
+                masked_name = name[0] + '*' * tail_len
+        elif self.mask_mode == 'placeholder':
+            masked_name = '[患者姓名]'
+        else:
+            return match.group(0)
         
-        for match in matches:
-            original = match.group(0)
-            
-            if self.mask_mode == 'remove':
-                # 完全移除
-                text = text.replace(original, '')
-            
-            elif self.mask_mode == 'asterisk':
-                # 用星号替换
-                if info_type == 'id_card':
-                    # 身份证: 保留前3位和后2位
-                    masked = original[:3] + '*' * (len(original) - 5) + original[-2:]
-                elif info_type == 'phone':
-                    # 手机号: 保留前3位和后4位
-                    masked = original[:3] + '****' + original[-4:]
-                elif info_type == 'hospital':
-                    # 医院: 保留前2个字和后2个字
-                    if len(original) > 4:
-                        masked = original[:2] + '*' * (len(original) - 4) + original[-2:]
-                    else:
-                        masked = '*' * len(original)
-                else:
-                    # 其他: 保留标签,内容用星号
-                    if ':' in original or '：' in original:
-                        parts = re.split(r'[:：]', original, 1)
-                        masked = parts[0] + ':***'
-                    else:
-                        masked = '*' * len(original)
-                
-                text = text.replace(original, masked)
-            
-            elif self.mask_mode == 'placeholder':
-                # 用占位符替换
-                placeholder = placeholders.get(info_type, '[敏感信息]')
-                text = text.replace(original, placeholder)
+        # 按分组位置拼接,字段名里出现与姓名相同的字也不会被改写
+        start = match.start()
+        original = match.group(0)
+        return original[:match.start(1) - start] + masked_name + original[match.end(1) - start:]
+    
+    def _replacement_for(self, match, info_type):
+        """计算单个匹配的脱敏结果"""
+        original = match.group(0)
         
-        return text
+        if info_type == 'hospital':
+            return self._mask_hospital_name(original)
+        
+        if self.mask_mode == 'remove':
+            # 完全移除
+            return ''
+        
+        elif self.mask_mode == 'asterisk':
+            # 用星号替换
+            if info_type == 'id_card':
+                # 身份证: 保留前3位和后2位
+                return original[:3] + '*' * (len(original) - 5) + original[-2:]
+            elif info_type == 'phone':
+                # 手机号: 保留前3位和后4位
+                return original[:3] + '****' + original[-4:]
+            # 其他: 保留标签,内容用星号
+            if ':' in original or '：' in original:
+                parts = _COLON_RE.split(original, maxsplit=1)
+                return parts[0] + ':***'
+            return '*' * len(original)
+        
+        elif self.mask_mode == 'placeholder':
+            # 用占位符替换
+            return _PLACEHOLDERS.get(info_type, '[敏感信息]')
+        
+        return original
+    
+    def _mask_hospital_name(self, name):
+        """医院名称脱敏"""
+        if self.mask_mode == 'remove':
+            return ''
+        elif self.mask_mode == 'asterisk':
+            # 医院: 保留前2个字和后2个字
+            if len(name) > 4:
+                return name[:2] + '*' * (len(name) - 4) + name[-2:]
+            return '*' * len(name)
+        elif self.mask_mode == 'placeholder':
+            return _PLACEHOLDERS['hospital']
+        return name
     
     def mask_report_item(self, item_name, content):
         """
@@ -198,8 +403,24 @@ class DataMasker:
 class MedicalReportSplitterWithMask:
     """带数据脱敏功能的检验报告分页处理器"""
     
+    # 报告页用到的字符样式(样式名 -> 字体属性),在 _set_document_style 中创建一次,各 run 直接引用
+    _RUN_STYLES = {
+        'TitleStyle': {'size': Pt(18), 'bold': True, 'name': '黑体', 'color': RGBColor(0, 0, 139)},
+        'NoticeStyle': {'size': Pt(9), 'italic': True, 'color': RGBColor(128, 128, 128)},
+        'SeparatorStyle': {'color': RGBColor(128, 128, 128)},
+        'LabelStyle': {'size': Pt(12), 'bold': True},
+        'ValueStyle': {'size': Pt(12), 'bold': True, 'color': RGBColor(0, 0, 128)},
+        'DateLabelStyle': {'size': Pt(11), 'bold': True},
+        'DateValueStyle': {'size': Pt(11), 'color': RGBColor(70, 70, 70)},
+        'ResultTitleStyle': {'size': Pt(11), 'bold': True, 'underline': True, 'color': RGBColor(0, 0, 0)},
+        'ResultTextStyle': {'size': Pt(10)},
+        'NormalResultStyle': {'size': Pt(10), 'color': RGBColor(0, 0, 0)},
+        'AbnormalResultStyle': {'size': Pt(10), 'bold': True, 'color': RGBColor(220, 20, 60)},
+        'FooterStyle': {'size': Pt(9), 'italic': True, 'color': RGBColor(128, 128, 128)},
+    }
+    
     def __init__(self, input_file, output_file=None, mask_mode='remove', 
-                 enable_masking=True):
+                 enable_masking=True, hospital_dictionary=None):
         """
         初始化
         
@@ -208,6 +429,7 @@ class MedicalReportSplitterWithMask:
             output_file: 输出的Word文档路径(可选)
             mask_mode: 脱敏模式 ('remove', 'asterisk', 'placeholder')
             enable_masking: 是否启用数据脱敏
+            hospital_dictionary: 已知医院名称列表(可选)
         """
         self.input_file = Path(input_file)
         if output_file:
@@ -217,69 +439,62 @@ class MedicalReportSplitterWithMask:
             suffix = '_脱敏分页版' if enable_masking else '_分页版'
             self.output_file = self.input_file.parent / f"{self.input_file.stem}{suffix}.docx"
         
-        self.test_items = []
+        # 检验项目按列存放: 名称、日期、内容三个等长列表,同一下标为同一项目
+        self.item_names = []
+        self.item_dates = []
+        self.item_contents = []
         self.enable_masking = enable_masking
-        self.masker = DataMasker(mask_mode) if enable_masking else None
+        self.masker = DataMasker(mask_mode, hospital_dictionary) if enable_masking else None
         
     def extract_text_from_docx(self):
         """从Word文档中提取文本"""
         try:
-            doc = Document(self.input_file)
-            full_text = '\n'.join([para.text for para in doc.paragraphs])
+            # 直接解析主文档部件(一般为 word/document.xml): 解析器与 python-docx 一致,
+            # 段落文本与 doc.paragraphs 相同,但不必加载整个文档包,也不为每个段落构造 Paragraph 对象
+            with zipfile.ZipFile(self.input_file) as package:
+                document = parse_xml(package.read(_main_document_member(package)))
+            paragraph_texts = (p.text for p in document.body.iterchildren(_P_TAG))
+            # 跳过空段落,省得后续正则扫描大段空行
+            full_text = '\n'.join(text for text in paragraph_texts if text)
             return full_text
         except Exception as e:
             raise Exception(f"读取文档失败: {str(e)}")
     
     def parse_test_items(self, text):
-        """解析检验项目"""
+        """
+        解析检验项目,返回 (名称列表, 日期列表, 内容列表)
+        
+        >>> splitter = MedicalReportSplitterWithMask('report.docx')
+        >>> names, dates, contents = splitter.parse_test_items(
+        ...     '【血常规】(2024-01-01)\\n地址:\\n北京市朝阳区建国路88号院3号楼\\n电话13812345678\\n'
+        ...     '【尿常规】(2024-01-02)\\n地址:\\n【肝功】(2024-01-03)\\nALT:30')
+        >>> names
+        ['血常规', '尿常规', '肝功']
+        >>> [c for c in contents if '建国路' in c or '13812345678' in c]
+        []
+        """
         # 如果启用脱敏,先对整个文本进行脱敏
         if self.enable_masking:
             text = self.masker.mask_text(text)
         
         # 正则表达式匹配检验项目
-        pattern = r'【([^】]+)】\(([0-9\-\s:]+)\)([^【]*)'
-        matches = re.findall(pattern, text, re.DOTALL)
-        
-        test_items = []
-        for match in matches:
-            item_name = match[0].strip()
-            date = match[1].strip()
-            content = match[2].strip()
-            
+        names, dates, contents = [], [], []
+        for match in _ITEM_RE.finditer(text):
+            names.append(match.group('name').strip())
+            dates.append(match.group('date').strip())
             # 清理内容中的换行符和多余空格
-            content = re.sub(r'\s+', ' ', content)
-            
-            # 对单个项目再次脱敏(双重保险)
-            if self.enable_masking:
-                item_name, content = self.masker.mask_report_item(item_name, content)
-            
-            test_items.append({
-                'name': item_name,
-                'date': date,
-                'content': content,
-                'raw_content': match[2]
-            })
+            # 全文已统一脱敏,这里不再逐项重复扫描(重复脱敏还会把"1980年"改写成"1980年年")
+            contents.append(_WHITESPACE_RUN_RE.sub(' ', match.group('content').strip()))
         
-        return test_items
+        return names, dates, contents
     
     def parse_results(self, content):
         """解析检验结果"""
-        # 按中英文逗号、分号分割
-        items = re.split(r'[,，;；]', content)
-        
-        results = []
-        for item in items:
-            item = item.strip()
-            if not item:
-                continue
-            
-            # 检查是否包含冒号
-            if ':' in item or '：' in item:
-                results.append(item)
-            elif len(item) > 2:
-                results.append(item)
-        
-        return results
+        # 按中英文逗号、分号分割,保留含冒号或长度大于2的项
+        return [
+            item for item in (part.strip() for part in _RESULT_SEP_RE.split(content))
+            if len(item) > 2 or ':' in item or '：' in item
+        ]
     
     def is_abnormal(self, result):
         """判断检验结果是否异常"""
@@ -293,17 +508,14 @@ class MedicalReportSplitterWithMask:
         # 设置文档默认样式
         self._set_document_style(new_doc)
         
-        total_items = len(self.test_items)
+        total_items = len(self.item_names)
         
-        for idx, item in enumerate(self.test_items, 1):
-            print(f"处理进度: {idx}/{total_items} - {item['name']}")
-            
-            # 添加报告页
-            self._add_report_page(new_doc, item, idx, total_items)
+        items = zip(self.item_names, self.item_dates, self.item_contents)
+        for idx, (name, date, content) in enumerate(items, 1):
+            print(f"处理进度: {idx}/{total_items} - {name}")
             
-            # 如果不是最后一项,添加分页符
-            if idx < total_items:
-                new_doc.add_page_break()
+            # 添加报告页(不是最后一项时自带分页符)
+            self._add_report_page(new_doc, name, date, content, idx, total_items)
         
         # 保存文档
         new_doc.save(self.output_file)
@@ -321,138 +533,83 @@ class MedicalReportSplitterWithMask:
         font.name = '宋体'
         font.size = Pt(10.5)
         style.element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
+        
+        # 创建报告页的字符样式,页面 XML 按样式 ID 引用
+        self._style_ids = {}
+        for style_name, attrs in self._RUN_STYLES.items():
+            run_style = doc.styles.add_style(style_name, WD_STYLE_TYPE.CHARACTER)
+            for attr, value in attrs.items():
+                if attr == 'color':
+                    run_style.font.color.rgb = value
+                else:
+                    setattr(run_style.font, attr, value)
+                if attr == 'name':
+                    run_style.element.rPr.rFonts.set(qn('w:eastAsia'), value)
+            self._style_ids[style_name] = run_style.style_id
     
-    def _add_report_page(self, doc, item, page_num, total_pages):
-        """添加单个报告页"""
-        # 1. 添加标题
-        self._add_title(doc, "检验报告单")
+    def _add_report_page(self, doc, name, date, content, page_num, total_pages):
+        """添加单个报告页: 整页拼成一段 XML,解析一次后插入正文末尾(sectPr 之前)"""
+        page = parse_xml(self._render_page_xml(name, date, content, page_num, total_pages))
+        body = doc.element.body
+        # sectPr 只会是 body 的最后一个子元素,从尾部取;body.sectPr 和 len(body) 都会从头扫描全部子元素,
+        # 页数多时整体退化为平方级
+        sect_pr = next(body.iterchildren(reversed=True), None)
+        if sect_pr is None or sect_pr.tag != _SECT_PR_TAG:
+            body.extend(page)
+            return
+        for element in list(page):
+            sect_pr.addprevious(element)
+    
+    def _render_page_xml(self, name, date, content, page_num, total_pages):
+        """生成单个报告页全部段落的 XML(不是最后一页时末尾带分页符)"""
+        style_ids = self._style_ids
+        separator = _paragraph_xml(_PPR_CENTER, _run_xml('─' * 60, style_ids['SeparatorStyle']))
         
-        # 2. 添加脱敏提示(如果启用了脱敏)
-        if self.enable_masking:
-            self._add_privacy_notice(doc)
-        
-        # 3. 添加分隔线
-        self._add_separator(doc)
-        
-        # 4. 添加检验项目信息
-        self._add_test_info(doc, item)
-        
-        # 5. 添加检验结果
-        self._add_test_results(doc, item)
-        
-        # 6. 添加页脚
-        self._add_footer(doc, page_num, total_pages)
-    
-    def _add_title(self, doc, title_text):
-        """添加居中标题"""
-        title = doc.add_paragraph()
-        title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        title_run = title.add_run(title_text)
-        title_run.font.size = Pt(18)
-        title_run.font.bold = True
-        title_run.font.name = '黑体'
-        title_run.font.color.rgb = RGBColor(0, 0, 139)
-        title_run._element.rPr.rFonts.set(qn('w:eastAsia'), '黑体')
-    
-    def _add_privacy_notice(self, doc):
-        """添加隐私保护提示"""
-        notice = doc.add_paragraph()
-        notice.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        notice_run = notice.add_run("(本报告已进行隐私保护处理)")
-        notice_run.font.size = Pt(9)
-        notice_run.font.italic = True
-        notice_run.font.color.rgb = RGBColor(128, 128, 128)
-    
-    def _add_separator(self, doc, char='─', length=60):
-        """添加分隔线"""
-        para = doc.add_paragraph(char * length)
-        para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        run = para.runs[0]
-        run.font.color.rgb = RGBColor(128, 128, 128)
-    
-    def _add_test_info(self, doc, item):
-        """添加检验项目基本信息"""
-        # 检验项目名称
-        name_para = doc.add_paragraph()
-        name_label = name_para.add_run("检验项目: ")
-        name_label.font.bold = True
-        name_label.font.size = Pt(12)
-        
-        name_value = name_para.add_run(item['name'])
-        name_value.font.size = Pt(12)
-        name_value.font.bold = True
-        name_value.font.color.rgb = RGBColor(0, 0, 128)
-        
-        # 检验日期
-        date_para = doc.add_paragraph()
-        date_label = date_para.add_run("检验日期: ")
-        date_label.font.bold = True
-        date_label.font.size = Pt(11)
-        
-        date_value = date_para.add_run(item['date'])
-        date_value.font.size = Pt(11)
-        date_value.font.color.rgb = RGBColor(70, 70, 70)
-        
-        # 添加空行
-        doc.add_paragraph()
-    
-    def _add_test_results(self, doc, item):
-        """添加检验结果详情"""
-        # 结果标题
-        result_title = doc.add_paragraph()
-        result_title_run = result_title.add_run('检验结果:')
-        result_title_run.font.size = Pt(11)
-        result_title_run.font.bold = True
-        result_title_run.font.underline = True
-        result_title_run.font.color.rgb = RGBColor(0, 0, 0)
-        
-        # 解析检验结果
-        results = self.parse_results(item['content'])
+        # 1. 标题
+        parts = [_paragraph_xml(_PPR_CENTER, _run_xml('检验报告单', style_ids['TitleStyle']))]
         
+        # 2. 脱敏提示(如果启用了脱敏)
+        if self.enable_masking:
+            parts.append(_paragraph_xml(
+                _PPR_CENTER, _run_xml('(本报告已进行隐私保护处理)', style_ids['NoticeStyle'])))
+        
+        # 3. 分隔线
+        parts.append(separator)
+        
+        # 4. 检验项目名称、检验日期,后接空行
+        parts.append(_paragraph_xml(
+            '',
+            _run_xml('检验项目: ', style_ids['LabelStyle']),
+            _run_xml(name, style_ids['ValueStyle'])))
+        parts.append(_paragraph_xml(
+            '',
+            _run_xml('检验日期: ', style_ids['DateLabelStyle']),
+            _run_xml(date, style_ids['DateValueStyle'])))
+        parts.append(_EMPTY_PARAGRAPH)
+        
+        # 5. 检验结果
+        parts.append(_paragraph_xml('', _run_xml('检验结果:', style_ids['ResultTitleStyle'])))
+        results = self.parse_results(content)
         if results:
+            # 异常值用红色加粗样式
+            bullet = _run_xml('• ', style_ids['ResultTextStyle'])
             for result in results:
-                self._add_result_item(doc, result)
+                abnormal = '↑' in result or '↓' in result
+                result_style = 'AbnormalResultStyle' if abnormal else 'NormalResultStyle'
+                parts.append(_paragraph_xml(_PPR_RESULT, bullet, _run_xml(result, style_ids[result_style])))
         else:
-            content_para = doc.add_paragraph()
-            content_para.paragraph_format.left_indent = Inches(0.3)
-            content_para.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-            content_run = content_para.add_run(item['content'])
-            content_run.font.size = Pt(10)
-    
-    def _add_result_item(self, doc, result):
-        """添加单个检验结果项"""
-        result_para = doc.add_paragraph()
-        result_para.paragraph_format.left_indent = Inches(0.3)
-        result_para.paragraph_format.space_after = Pt(3)
-        
-        # 添加项目符号
-        bullet = result_para.add_run("• ")
-        bullet.font.size = Pt(10)
-        
-        # 添加结果内容
-        result_run = result_para.add_run(result)
-        result_run.font.size = Pt(10)
-        
-        # 如果是异常值,设置为红色加粗
-        if self.is_abnormal(result):
-            result_run.font.color.rgb = RGBColor(220, 20, 60)
-            result_run.font.bold = True
-        else:
-            result_run.font.color.rgb = RGBColor(0, 0, 0)
-    
-    def _add_footer(self, doc, page_num, total_pages):
-        """添加页脚信息"""
-        doc.add_paragraph()
-        self._add_separator(doc, '─', 60)
+            parts.append(_paragraph_xml(_PPR_CONTENT, _run_xml(content, style_ids['ResultTextStyle'])))
+        
+        # 6. 页脚
+        parts.append(_EMPTY_PARAGRAPH)
+        parts.append(separator)
+        parts.append(_paragraph_xml(
+            _PPR_RIGHT, _run_xml(f"第 {page_num} / {total_pages} 页", style_ids['FooterStyle'])))
         
-        footer = doc.add_paragraph()
-        footer.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+        if page_num < total_pages:
+            parts.append(_PAGE_BREAK)
         
-        footer_text = f"第 {page_num} / {total_pages} 页"
-        footer_run = footer.add_run(footer_text)
-        footer_run.font.size = Pt(9)
-        footer_run.font.italic = True
-        footer_run.font.color.rgb = RGBColor(128, 128, 128)
+        return f'<w:body {nsdecls("w")}>{"".join(parts)}</w:body>'
     
     def process(self):
         """执行完整的处理流程"""
@@ -464,12 +621,12 @@ class MedicalReportSplitterWithMask:
             
             # 2. 解析检验项目
             print("正在解析检验项目...")
-            self.test_items = self.parse_test_items(text)
+            self.item_names, self.item_dates, self.item_contents = self.parse_test_items(text)
             
-            if not self.test_items:
+            if not self.item_names:
                 raise Exception("未找到任何检验项目!请检查文档格式是否正确。")
             
-            print(f"共找到 {len(self.test_items)} 个检验项目")
+            print(f"共找到 {len(self.item_names)} 个检验项目")
             
             # 3. 创建分页报告
             output_path = self.create_report_document()
@@ -515,6 +672,8 @@ def main():
                        help='脱敏模式: remove(移除), asterisk(星号), placeholder(占位符)')
     parser.add_argument('--no-mask', action='store_true',
                        help='不启用数据脱敏')
+    parser.add_argument('--hospital-list',
+                       help='医院名称词典文件(每行一个名称),提供时按词典识别医院名称')
     
     args = parser.parse_args()
     
@@ -523,13 +682,20 @@ def main():
         print(f"✗ 错误: 输入文件不存在: {args.input_file}")
         return 1
     
+    hospital_dictionary = None
+    if args.hospital_list:
+        hospital_dictionary = [
+            line.strip() for line in Path(args.hospital_list).read_text(encoding='utf-8').splitlines()
+        ]
+    
     try:
         # 创建处理器并执行
         splitter = MedicalReportSplitterWithMask(
             input_file=args.input_file,
             output_file=args.output_file,
             mask_mode=args.mask_mode,
-            enable_masking=not args.no_mask
+            enable_masking=not args.no_mask,
+            hospital_dictionary=hospital_dictionary
         )
         output_path = splitter.process()
         
@@ -558,77 +724,73 @@ from collections import OrderedDict as _OrderedDict
 # Patch DataMasker behavior in-place, keeping existing interfaces.
 _DataMasker_orig_init = DataMasker.__init__
 
-def _DataMasker_init_patched(self, mask_mode='remove'):
-    _DataMasker_orig_init(self, mask_mode=mask_mode)
+def _DataMasker_init_patched(self, mask_mode='remove', hospital_dictionary=None):
+    _DataMasker_orig_init(self, mask_mode=mask_mode, hospital_dictionary=hospital_dictionary)
     # keep gender/age (do not mask)
     self.patterns.pop('gender', None)
     self.patterns.pop('age', None)
-    # strongest id-card pattern
-    self.patterns['id_card'] = r'\b\d{15}\b|\b\d{17}[\dXx]\b'
+    # strongest id-card pattern (digit lookarounds also catch ids glued to CJK text)
+    self.patterns['id_card'] = r'(?<![0-9０-９])(?:[0-9０-９]{17}[0-9０-９Xx]|[0-9０-９]{15})(?![0-9０-９])'
     # DOB keep year only (capture)
     self.patterns['birth_date'] = r'((?:出生日期|生日|出生)[:：]\s*)(?:\D*)?((?:19|20)\d{2})(?:\d{2}(?:\d{2})?|[-/年]\d{1,2}[-/月]\d{1,2}日?)?'
     # hospital mapping A/B/C...
     self._hospital_mapping = _OrderedDict()
     self._hospital_counter = 0
 
-def _mask_by_pattern_patched(self, text, pattern, info_type):
-    matches = list(re.finditer(pattern, text))
-    placeholders = {
-        'id_card': '[身份证号]',
-        'admission_no': '住院号:[住院号]',
-        'phone': '[手机号]',
-        'birth_date': '出生日期:[出生日期]',
-    }
-    for match in matches:
-        original = match.group(0)
-        if info_type == 'hospital':
-            if original not in self._hospital_mapping:
-                self._hospital_counter += 1
-                suffix = chr(64 + self._hospital_counter) if self._hospital_counter <= 26 else str(self._hospital_counter)
-                self._hospital_mapping[original] = f'hospital {suffix}'
-            text = text.replace(original, self._hospital_mapping[original])
-            continue
-        if info_type == 'birth_date':
-            # keep year only
-            try:
-                prefix, year = match.group(1), match.group(2)
-                text = text.replace(original, f"{prefix}{year}年")
-            except Exception:
-                pass
-            continue
-        if info_type == 'admission_no':
-            # 医疗编号统一替换为CODE
-            try:
-                parts = re.split(r'[:：]', original, 1)
-                prefix = parts[0] + ':' if len(parts) > 1 else ''
-                text = text.replace(original, f"{prefix}CODE")
-            except Exception:
-                text = text.replace(original, 'CODE')
-            continue
-        if self.mask_mode == 'remove':
-            text = text.replace(original, '')
-        elif self.mask_mode == 'asterisk':
-            if info_type == 'id_card':
-                masked = original[:3] + '*' * (len(original) - 5) + original[-2:]
-            elif info_type == 'phone':
-                masked = original[:3] + '****' + original[-4:]
-            elif info_type == 'admission_no':
-                parts = re.split(r'[:：]', original, 1)
-                masked = parts[0] + ':***' if len(parts) > 1 else '***'
-            else:
-                if ':' in original or '：' in original:
-                    parts = re.split(r'[:：]', original, 1)
-                    masked = parts[0] + ':***'
-                else:
-                    masked = '*' * len(original)
-            text = text.replace(original, masked)
-        elif self.mask_mode == 'placeholder':
-            placeholder = placeholders.get(info_type, '[敏感信息]')
-            text = text.replace(original, placeholder)
-    return text
+_PATCH_PLACEHOLDERS = {
+    'id_card': '[身份证号]',
+    'admission_no': '住院号:[住院号]',
+    'phone': '[手机号]',
+    'birth_date': '出生日期:[出生日期]',
+}
+
+def _replacement_for_patched(self, match, info_type):
+    original = match.group(0)
+    if info_type == 'hospital':
+        return self._mask_hospital_name(original)
+    if info_type == 'birth_date':
+        # keep year only; groups sit after the named group in the combined regex
+        base = match.re.groupindex.get(info_type, 0)
+        try:
+            prefix, year = match.group(base + 1), match.group(base + 2)
+            return f"{prefix}{year}年"
+        except Exception:
+            return original
+    if info_type == 'admission_no':
+        # 医疗编号统一替换为CODE
+        try:
+            parts = _COLON_RE.split(original, maxsplit=1)
+            prefix = parts[0] + ':' if len(parts) > 1 else ''
+            return f"{prefix}CODE"
+        except Exception:
+            return 'CODE'
+    if self.mask_mode == 'remove':
+        return ''
+    elif self.mask_mode == 'asterisk':
+        if info_type == 'id_card':
+            return original[:3] + '*' * (len(original) - 5) + original[-2:]
+        elif info_type == 'phone':
+            return original[:3] + '****' + original[-4:]
+        if ':' in original or '：' in original:
+            parts = _COLON_RE.split(original, maxsplit=1)
+            return parts[0] + ':***'
+        return '*' * len(original)
+    elif self.mask_mode == 'placeholder':
+        return _PATCH_PLACEHOLDERS.get(info_type, '[敏感信息]')
+    return original
 
 DataMasker.__init__ = _DataMasker_init_patched
-DataMasker._mask_by_pattern = _mask_by_pattern_patched
+def _mask_hospital_name_patched(self, name):
+    # called straight from the sub() callbacks: one dict probe per hit, no text.replace
+    label = self._hospital_mapping.get(name)
+    if label is None:
+        self._hospital_counter += 1
+        suffix = chr(64 + self._hospital_counter) if self._hospital_counter <= 26 else str(self._hospital_counter)
+        label = self._hospital_mapping[name] = f'hospital {suffix}'
+    return label
+
+DataMasker._replacement_for = _replacement_for_patched
+DataMasker._mask_hospital_name = _mask_hospital_name_patched
 
 
 